@@ -4632,3 +4632,5 @@ class CloneSchema:
             },
         )
         cursor.close()
+        # The clone ran its DDL inside a function, out of sight of the cache.
+        connection.introspection.clear_cache()
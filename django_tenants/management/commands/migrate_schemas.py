@@ -1,6 +1,9 @@
+from operator import itemgetter
+
 from django.db.migrations.autodetector import MigrationAutodetector
 
 from django_tenants.migration_executors import get_executor
+from django_tenants.migration_executors.unapplied import get_schemas_with_unapplied_migrations
 from django_tenants.utils import get_tenant_model, get_public_schema_name, schema_exists, get_tenant_database_alias, \
     has_multi_type_tenants, get_multi_type_database_field_name, get_tenant_migration_order
 from django_tenants.management.commands import SyncCommon
@@ -54,8 +57,36 @@ class MigrateSchemasCommand(SyncCommon):
                             help='Exits with a non-zero status if unapplied migrations exist.')
         parser.add_argument('--parallel', type=int, default=None,
                             help='Number of tenant migrations to run in parallel. Only used '
-                                 'by --executor=subprocess. Overrides TENANT_SUBPROCESS_PARALLEL '
-                                 '(default: 1).')
+                                 'by --executor=subprocess and --executor=threaded. Overrides '
+                                 'TENANT_SUBPROCESS_PARALLEL (default: 1) and TENANT_THREADED_PARALLEL '
+                                 '(default: 4).')
+        parser.add_argument('--skip-up-to-date', action='store_true', dest='skip_up_to_date',
+                            help='Reads the migrations applied to every tenant schema at once, and only migrates '
+                                 'tenants with migrations left to apply. --check always does.')
+
+    def _only_unapplied(self, tenants, schema_name=lambda tenant: tenant):
+        """
+        Returns the `tenants` with migrations left to apply when the options
+        allow telling them apart up front, else all `tenants`.
+        """
+        if not (self.options.get('check_unapplied') or self.options.get('skip_up_to_date')):
+            return tenants
+        # Going back to a migration, or pruning, is not about migrations left to apply.
+        if self.options.get('migration_name') or self.options.get('prune') or self.options.get('run_syncdb'):
+            return tenants
+
+        tenants = list(tenants)
+        unapplied = get_schemas_with_unapplied_migrations(
+            [schema_name(tenant) for tenant in tenants],
+            self.options.get('database', get_tenant_database_alias()),
+            app_label=self.options.get('app_label'))
+        if unapplied is None:
+            return tenants
+
+        if int(self.options.get('verbosity', 1)) >= 1:
+            self.stdout.write(self.style.NOTICE(
+                '%d of %d tenants have migrations left to apply.' % (len(unapplied), len(tenants))))
+        return [tenant for tenant in tenants if schema_name(tenant) in unapplied]
 
     def handle(self, *args, **options):
         super().handle(*args, **options)
@@ -78,10 +109,10 @@ class MigrateSchemasCommand(SyncCommon):
                     tenants = get_tenant_model().objects.only('schema_name', type_field_name)\
                         .filter(schema_name=self.schema_name)\
                         .values_list('schema_name', type_field_name)
-                    executor.run_multi_type_migrations(tenants=tenants)
+                    executor.run_multi_type_migrations(tenants=self._only_unapplied(tenants, itemgetter(0)))
                 else:
                     tenants = [self.schema_name]
-                    executor.run_migrations(tenants=tenants)
+                    executor.run_migrations(tenants=self._only_unapplied(tenants))
             else:
                 migration_order = get_tenant_migration_order()
 
@@ -94,7 +125,7 @@ class MigrateSchemasCommand(SyncCommon):
                     if migration_order is not None:
                         tenants = tenants.order_by(*migration_order)
 
-                    executor.run_multi_type_migrations(tenants=tenants)
+                    executor.run_multi_type_migrations(tenants=self._only_unapplied(tenants, itemgetter(0)))
                 else:
                     tenants = get_tenant_model().objects.only(
                         'schema_name').exclude(
@@ -104,7 +135,7 @@ class MigrateSchemasCommand(SyncCommon):
                     if migration_order is not None:
                         tenants = tenants.order_by(*migration_order)
 
-                    executor.run_migrations(tenants=tenants)
+                    executor.run_migrations(tenants=self._only_unapplied(tenants))
 
 
 Command = MigrateSchemasCommand
@@ -1,5 +1,5 @@
 from django_tenants.middleware.suspicious import SuspiciousTenantMiddleware
-from django_tenants.utils import get_public_schema_name, get_tenant_model
+from django_tenants.utils import get_public_schema_name
 
 
 class DefaultTenantMiddleware(SuspiciousTenantMiddleware):
@@ -21,5 +21,4 @@ class DefaultTenantMiddleware(SuspiciousTenantMiddleware):
             schema_name = self.DEFAULT_SCHEMA_NAME
             if not schema_name:
                 schema_name = get_public_schema_name()
-            tenant_model = get_tenant_model()
-            return tenant_model.objects.get(schema_name=schema_name)
+            return self.get_tenant_by_schema_name(schema_name)
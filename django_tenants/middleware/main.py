@@ -1,3 +1,4 @@
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.core.exceptions import DisallowedHost
 from django.db import connection
@@ -6,8 +7,12 @@ from django.urls import set_urlconf
 from django.utils.module_loading import import_string
 from django.utils.deprecation import MiddlewareMixin
 
+from django_tenants.resolvers import get_tenant_resolvers
+from django_tenants.tenant_cache import get_cached_tenant_nowait, get_domain_cache, get_domain_snapshot, \
+    get_negative_cache, get_shared_cache, schema_cache_key, wildcard_domains
 from django_tenants.utils import remove_www, get_public_schema_name, get_tenant_types, \
-    has_multi_type_tenants, get_tenant_domain_model, get_public_schema_urlconf
+    has_multi_type_tenants, get_tenant_domain_model, get_public_schema_urlconf, get_tenant_wildcard_domains, \
+    get_tenant_model
 
 
 class TenantMainMiddleware(MiddlewareMixin):
@@ -26,13 +31,97 @@ class TenantMainMiddleware(MiddlewareMixin):
         return remove_www(request.get_host().split(':')[0])
 
     def get_tenant(self, domain_model, hostname):
-        domain = domain_model.objects.select_related('tenant').get(domain=hostname)
-        return domain.tenant
+        domain_snapshot = get_domain_snapshot()
+        if domain_snapshot is not None:
+            tenant = domain_snapshot.get(hostname)
+            if tenant is not None:
+                return tenant
+
+        return self.get_cached_tenant(hostname, domain_model, lambda: self.get_domain(domain_model, hostname).tenant)
+
+    def get_tenant_by_schema_name(self, schema_name):
+        """
+        Returns the tenant with `schema_name`, through the same caches as
+        hostnames. Raises the tenant model's DoesNotExist if there is none.
+        """
+        domain_snapshot = get_domain_snapshot()
+        if domain_snapshot is not None:
+            tenant = domain_snapshot.get_by_schema_name(schema_name)
+            if tenant is not None:
+                return tenant
+
+        tenant_model = get_tenant_model()
+        return self.get_cached_tenant(schema_cache_key(schema_name), tenant_model,
+                                      lambda: tenant_model.objects.get(schema_name=schema_name))
+
+    @staticmethod
+    def get_cached_tenant(key, model, load):
+        """
+        Returns the tenant cached under `key`, calling `load` to fetch it from
+        the database on a miss. Keys for which `load` raised `model`'s
+        DoesNotExist are refused without calling it again for a while.
+        """
+        domain_cache = get_domain_cache()
+        if domain_cache is not None:
+            tenant = domain_cache.get(key)
+            if tenant is not None:
+                return tenant
+
+        shared_cache = get_shared_cache()
+        generation = shared_cache.get_generation() if shared_cache is not None else None
+
+        # Keys that recently failed to resolve are refused without asking the
+        # database again, so junk Host headers don't cost a query each. With a
+        # shared cache, only until a tenant or domain changes in any worker.
+        negative_cache = get_negative_cache()
+        if negative_cache is not None and negative_cache.contains(key, generation):
+            raise model.DoesNotExist('%s matching query does not exist.' % model._meta.object_name)
+
+        tenant = shared_cache.get(generation, key) if shared_cache is not None else None
+        if tenant is None:
+            try:
+                tenant = load()
+            except model.DoesNotExist:
+                if negative_cache is not None:
+                    negative_cache.add(key, generation)
+                raise
+
+            if shared_cache is not None:
+                shared_cache.set(generation, key, tenant)
+
+        if domain_cache is not None:
+            domain_cache.set(key, tenant)
+        return tenant
+
+    @staticmethod
+    def get_domain(domain_model, hostname):
+        """
+        Fetches the domain matching `hostname` from the database. With
+        ``TENANT_WILDCARD_DOMAINS`` the exact hostname and every wildcard that
+        could match it are fetched in a single query; the exact hostname wins,
+        then the most specific wildcard.
+        """
+        if not get_tenant_wildcard_domains():
+            return domain_model.objects.select_related('tenant').get(domain=hostname)
+
+        candidates = [hostname] + wildcard_domains(hostname)
+        domains = {domain.domain: domain
+                   for domain in domain_model.objects.select_related('tenant').filter(domain__in=candidates)}
+        for candidate in candidates:
+            if candidate in domains:
+                return domains[candidate]
+        raise domain_model.DoesNotExist('%s matching query does not exist.' % domain_model._meta.object_name)
 
     def process_request(self, request):
+        # A tenant this process already caches needs no database to resolve,
+        # nor the switch to the public schema below.
+        tenant = self.get_tenant_nowait(request) if self._resolves_tenants_itself() else None
+        if tenant is not None:
+            self.activate_tenant(request, tenant)
+            return
+
         # Connection needs first to be at the public schema, as this is where
         # the tenant metadata is stored.
-
         connection.set_schema_to_public()
         try:
             hostname = self.hostname_from_request(request)
@@ -41,17 +130,80 @@ class TenantMainMiddleware(MiddlewareMixin):
             return HttpResponseNotFound()
 
         domain_model = get_tenant_domain_model()
+        schema_name = self.get_resolved_schema_name(request)
         try:
-            tenant = self.get_tenant(domain_model, hostname)
-        except domain_model.DoesNotExist:
+            if schema_name is not None:
+                tenant = self.get_tenant_by_schema_name(schema_name)
+            else:
+                tenant = self.get_tenant(domain_model, hostname)
+        except (domain_model.DoesNotExist, get_tenant_model().DoesNotExist):
             default_tenant = self.no_tenant_found(request, hostname)
             return default_tenant
 
         tenant.domain_url = hostname
+        self.activate_tenant(request, tenant)
+
+    def activate_tenant(self, request, tenant):
+        """
+        Sets `tenant` on the request and the connection, and routes the request
+        to its urlconf.
+        """
         request.tenant = tenant
         connection.set_tenant(request.tenant)
         self.setup_url_routing(request)
 
+    def get_tenant_nowait(self, request):
+        """
+        Returns the tenant for the request if this process's caches already
+        hold it, otherwise None. Never touches the database.
+        """
+        try:
+            hostname = self.hostname_from_request(request)
+        except DisallowedHost:
+            return None
+
+        tenant = get_cached_tenant_nowait(hostname=hostname, schema_name=self.get_resolved_schema_name(request))
+        if tenant is not None:
+            tenant.domain_url = hostname
+        return tenant
+
+    @staticmethod
+    def get_resolved_schema_name(request):
+        """
+        Returns the schema name the first of the ``TENANT_RESOLVERS`` finds for
+        the request, or None if none of them identifies its tenant.
+        """
+        for resolver in get_tenant_resolvers():
+            schema_name = resolver.get_schema_name(request)
+            if schema_name is not None:
+                return schema_name
+        return None
+
+    def _resolves_tenants_itself(self):
+        # A subclass resolving tenants its own way must get its hooks called,
+        # rather than have the tenant answered from the caches.
+        return all(getattr(type(self), name).__module__.startswith('django_tenants.')
+                   for name in ('process_request', 'get_tenant', 'get_tenant_by_schema_name'))
+
+    async def __acall__(self, request):
+        """
+        Under ASGI, a tenant already cached in this process is resolved on the
+        event loop. Activating it still takes one trip to the request's sync
+        thread, as database connections are bound to that thread, but nothing
+        in that trip waits on I/O. Anything else runs ``process_request`` in
+        that same single trip.
+        """
+        tenant = self.get_tenant_nowait(request) if self._resolves_tenants_itself() else None
+        if tenant is not None:
+            await sync_to_async(self.activate_tenant, thread_sensitive=True)(request, tenant)
+            response = None
+        else:
+            response = await sync_to_async(self.process_request, thread_sensitive=True)(request)
+        response = response or await self.get_response(request)
+        if hasattr(self, 'process_response'):
+            response = await sync_to_async(self.process_response, thread_sensitive=True)(request, response)
+        return response
+
     def no_tenant_found(self, request, hostname):
         """ What should happen if no tenant is found.
         This makes it easier if you want to override the default behavior """
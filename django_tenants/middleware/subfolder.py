@@ -1,9 +1,9 @@
-from django.conf import settings
-from django.core.exceptions import ImproperlyConfigured
+from django.core.exceptions import DisallowedHost, ImproperlyConfigured
 from django.db import connection
 from django.http import Http404
-from django.urls import set_urlconf, clear_url_caches
+from django.urls import set_urlconf
 from django_tenants.middleware import TenantMainMiddleware
+from django_tenants.tenant_cache import get_cached_tenant_nowait
 from django_tenants.urlresolvers import get_subfolder_urlconf
 from django_tenants.utils import (
     get_public_schema_name,
@@ -36,24 +36,36 @@ class TenantSubfolderMiddleware(TenantMainMiddleware):
         if hasattr(request, "tenant"):
             return
 
-        connection.set_schema_to_public()
+        # A tenant this process already caches needs neither the database
+        # nor the switch to the public schema.
+        tenant = self.get_tenant_nowait(request) if self._resolves_tenants_itself() else None
+        if tenant is not None:
+            self.activate_tenant(request, tenant)
+            return
 
-        urlconf = None
+        connection.set_schema_to_public()
 
         tenant_model = get_tenant_model()
         domain_model = get_tenant_domain_model()
         hostname = self.hostname_from_request(request)
         subfolder_prefix_path = "/{}/".format(get_subfolder_prefix())
 
+        schema_name = self.get_resolved_schema_name(request)
+
+        # A resolver named the tenant, which is routed without a subfolder
+        if schema_name is not None:
+            try:
+                tenant = self.get_tenant_by_schema_name(schema_name)
+            except tenant_model.DoesNotExist:
+                return self.no_tenant_found(request, schema_name)
+
         # We are in the public tenant
-        if not request.path.startswith(subfolder_prefix_path):
+        elif not request.path.startswith(subfolder_prefix_path):
             try:
-                tenant = tenant_model.objects.get(schema_name=get_public_schema_name())
+                tenant = self.get_tenant_by_schema_name(get_public_schema_name())
             except tenant_model.DoesNotExist:
                 raise self.TENANT_NOT_FOUND_EXCEPTION("Unable to find public tenant")
 
-            self.setup_url_routing(request, force_public=True)
-
         # We are in a specific tenant
         else:
             path_chunks = request.path[len(subfolder_prefix_path):].split("/")
@@ -64,18 +76,46 @@ class TenantSubfolderMiddleware(TenantMainMiddleware):
                 return self.no_tenant_found(request, tenant_subfolder)
 
             tenant.domain_subfolder = tenant_subfolder
-            urlconf = self.get_urlconf(tenant=tenant)
 
         tenant.domain_url = hostname
-        request.tenant = tenant
+        self.activate_tenant(request, tenant)
 
+    def activate_tenant(self, request, tenant):
+        request.tenant = tenant
         connection.set_tenant(request.tenant)
-        clear_url_caches()  # Required to remove previous tenant prefix from cache, if present
 
-        if urlconf:
+        if getattr(tenant, "domain_subfolder", None) is None:
+            self.setup_url_routing(request)
+        else:
+            urlconf = self.get_urlconf(tenant=tenant)
             request.urlconf = urlconf
             set_urlconf(urlconf)
 
+    def get_tenant_nowait(self, request):
+        if hasattr(request, "tenant"):
+            return None
+
+        try:
+            hostname = self.hostname_from_request(request)
+        except DisallowedHost:
+            return None
+        subfolder_prefix_path = "/{}/".format(get_subfolder_prefix())
+        schema_name = self.get_resolved_schema_name(request)
+
+        if schema_name is not None:
+            tenant = get_cached_tenant_nowait(schema_name=schema_name)
+        elif not request.path.startswith(subfolder_prefix_path):
+            tenant = get_cached_tenant_nowait(schema_name=get_public_schema_name())
+        else:
+            tenant_subfolder = request.path[len(subfolder_prefix_path):].split("/")[0]
+            tenant = get_cached_tenant_nowait(hostname=tenant_subfolder)
+            if tenant is not None:
+                tenant.domain_subfolder = tenant_subfolder
+
+        if tenant is not None:
+            tenant.domain_url = hostname
+        return tenant
+
     @staticmethod
     def get_urlconf(tenant):
         return get_subfolder_urlconf(tenant)
@@ -4,6 +4,7 @@ from .base import MigrationExecutor
 from .multiproc import MultiprocessingExecutor  # noqa
 from .standard import StandardExecutor
 from .subproc import SubprocessExecutor  # noqa
+from .threaded import ThreadedExecutor  # noqa
 
 
 def get_executor(codename=None):
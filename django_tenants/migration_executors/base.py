@@ -11,6 +11,8 @@ from django_tenants.utils import (
     get_tenant_database_alias,
 )
 
+from .loader import get_cached_migrate_command_class
+
 
 def run_migrations(args, options, executor_codename, schema_name, tenant_type='',
                    allow_atomic=True, idx=None, count=None):
@@ -51,13 +53,17 @@ def run_migrations(args, options, executor_codename, schema_name, tenant_type=''
     migration_recorder.ensure_schema()
     connection.set_schema(schema_name, tenant_type=tenant_type)
                        
-    stdout = OutputWrapper(sys.stdout)
+    # The command wraps these again, and ends the lines itself: with an ending
+    # of their own, "Applying..." and its " OK" would come out on two lines.
+    stdout = OutputWrapper(sys.stdout, ending='')
     stdout.style_func = style_func
-    stderr = OutputWrapper(sys.stderr)
+    stderr = OutputWrapper(sys.stderr, ending='')
     stderr.style_func = style_func
     if int(options.get('verbosity', 1)) >= 1:
-        stdout.write(style.NOTICE("=== Starting migration"))
-    migrate_command_class = get_tenant_base_migrate_command_class()
+        stdout.write(style.NOTICE("=== Starting migration"), ending='\n')
+    # The migrations, their graph and project states are the same for every
+    # schema: the command builds them once, and reuses them from then on.
+    migrate_command_class = get_cached_migrate_command_class(get_tenant_base_migrate_command_class())
     migrate_command_class(stdout=stdout, stderr=stderr).execute(*args, **options)
 
     try:
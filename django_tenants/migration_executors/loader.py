@@ -0,0 +1,254 @@
+import functools
+import importlib.util
+import os
+import threading
+from types import FunctionType
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import no_translations
+from django.core.management.commands import migrate
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+
+from django_tenants.utils import get_migration_state_cache_size
+
+
+class ThreadSafeMigrationLoader(MigrationLoader):
+    """
+    A MigrationLoader several threads can build at once. Loading migrations
+    from disk reloads the apps' migrations packages, which two threads must
+    not do at the same time.
+    """
+    _load_disk_lock = threading.Lock()
+
+    def load_disk(self):
+        with self._load_disk_lock:
+            super().load_disk()
+
+
+def get_migration_files():
+    """
+    Returns the path and modification time of the files in the migrations
+    packages of the installed apps.
+    """
+    files = []
+    for app_config in apps.get_app_configs():
+        module_name, _ = MigrationLoader.migrations_module(app_config.label)
+        if module_name is None:
+            continue
+        try:
+            spec = importlib.util.find_spec(module_name)
+        except (ImportError, ValueError):
+            continue
+        if spec is None or not spec.submodule_search_locations:
+            continue
+        for path in spec.submodule_search_locations:
+            try:
+                with os.scandir(path) as entries:
+                    files.extend((entry.path, entry.stat().st_mtime_ns) for entry in entries
+                                 if entry.name.endswith('.py'))
+            except OSError:
+                continue
+    return sorted(files)
+
+
+class MigrationCache:
+    """
+    What migrating schema after schema keeps building again: the migrations
+    on disk, the graph of them, and the project states made from it. It is
+    kept for the life of the process, until the migrations change.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.sources = None
+            self.disk = {}
+            self.graphs = {}
+            self.project_states = {}
+
+    def check_sources(self):
+        """
+        Clears the cache if the installed apps, where their migrations are,
+        or the migration files themselves changed since it was filled.
+        """
+        sources = (list(apps.app_configs), dict(settings.MIGRATION_MODULES), get_migration_files())
+        with self.lock:
+            if sources != self.sources:
+                self.clear()
+                self.sources = sources
+
+    def get_project_state(self, key, create, render=False):
+        """
+        Returns a clone of the project state cached under `key`, creating it
+        with `create()`, and rendering its apps if `render`, if it is not.
+        """
+        size = get_migration_state_cache_size()
+        if not size:
+            return create()
+
+        # Threads migrating schemas at once wait for the first to create it.
+        with self.lock:
+            state = self.project_states.get(key)
+            if state is None:
+                state = create()
+                if render:
+                    state.apps
+                while len(self.project_states) >= size:
+                    self.project_states.pop(next(iter(self.project_states)))
+                self.project_states[key] = state
+        return state.clone()
+
+
+class CachedMigrationLoader(ThreadSafeMigrationLoader):
+    """
+    A MigrationLoader that loads the migrations from disk, and builds their
+    graph, once for all the schemas it is used on: only the migrations
+    applied to each schema are read again.
+    """
+    cache = MigrationCache()
+
+    def load_disk(self):
+        with self.cache.lock:
+            self.cache.check_sources()
+            disk = self.cache.disk.get(self.ignore_no_migrations)
+            if disk is None:
+                super().load_disk()
+                disk = self.cache.disk[self.ignore_no_migrations] = (
+                    self.disk_migrations, self.unmigrated_apps, self.migrated_apps)
+        disk_migrations, unmigrated_apps, migrated_apps = disk
+        self.disk_migrations = dict(disk_migrations)
+        self.unmigrated_apps = set(unmigrated_apps)
+        self.migrated_apps = set(migrated_apps)
+
+    def build_graph(self):
+        self.load_disk()
+        if self.connection is None:
+            applied_migrations = {}
+        else:
+            applied_migrations = MigrationRecorder(self.connection).applied_migrations()
+
+        # The graph only depends on which squashed migrations are partially
+        # applied, and so cannot replace the migrations they squash.
+        partially_applied = frozenset(
+            key for key, migration in self.disk_migrations.items()
+            if migration.replaces and len({target in applied_migrations for target in migration.replaces}) > 1)
+        self.graph_key = (self.ignore_no_migrations, self.replace_migrations, partially_applied)
+        with self.cache.lock:
+            graph = self.cache.graphs.get(self.graph_key)
+            if graph is None:
+                graph = self.cache.graphs[self.graph_key] = self._build_graph(partially_applied)
+
+        self.graph, self.replacements = graph
+        self.applied_migrations = applied_migrations
+        if self.replace_migrations:
+            for key, migration in self.replacements.items():
+                if all(target in applied_migrations for target in migration.replaces):
+                    applied_migrations[key] = migration
+                else:
+                    applied_migrations.pop(key, None)
+
+    def _build_graph(self, partially_applied):
+        """
+        Returns the graph of the migrations on disk, and the squashed
+        migrations, leaving out those in `partially_applied` in favour of the
+        migrations they replace.
+        """
+        # The applied migrations have been read already: Django builds the
+        # graph without them, and without replacing anything, which is then
+        # done here as it would have.
+        connection, replace_migrations = self.connection, self.replace_migrations
+        self.connection, self.replace_migrations = None, False
+        try:
+            super().build_graph()
+        finally:
+            self.connection, self.replace_migrations = connection, replace_migrations
+
+        if replace_migrations:
+            for key, migration in self.replacements.items():
+                if key in partially_applied:
+                    self.graph.remove_replacement_node(key, migration.replaces)
+                else:
+                    self.graph.remove_replaced_nodes(key, migration.replaces)
+            self.graph.validate_consistency()
+            self.graph.ensure_not_cyclic()
+        return self.graph, self.replacements
+
+    def project_state(self, nodes=None, at_end=True):
+        if nodes is not None or not at_end:
+            return super().project_state(nodes, at_end)
+        return self.cache.get_project_state(
+            ('graph', self.graph_key), lambda: super(CachedMigrationLoader, self).project_state())
+
+
+class CachedMigrationExecutor(MigrationExecutor):
+    """
+    A MigrationExecutor that loads migrations with CachedMigrationLoader,
+    and reuses the project state, rendered, of schemas with the same
+    migrations applied.
+    """
+
+    def __init__(self, connection, progress_callback=None):
+        self.connection = connection
+        self.loader = CachedMigrationLoader(self.connection)
+        self.recorder = MigrationRecorder(self.connection)
+        self.progress_callback = progress_callback
+
+    def _create_project_state(self, with_applied_migrations=False):
+        graph_key = getattr(self.loader, 'graph_key', None)
+        if not with_applied_migrations or graph_key is None:
+            return super()._create_project_state(with_applied_migrations)
+
+        applied_migrations = frozenset(key for key in self.loader.applied_migrations if key in self.loader.graph.nodes)
+        return self.loader.cache.get_project_state(
+            (graph_key, applied_migrations),
+            lambda: super(CachedMigrationExecutor, self)._create_project_state(with_applied_migrations=True),
+            render=True)
+
+
+def _with_migration_executor(handle, executor_class):
+    """
+    Returns a copy of the handle() of Django's migrate command that runs
+    migrations with `executor_class`. Django's migrate module is left as it
+    is, so that other commands, and other threads, are unaffected.
+    """
+    # @no_translations keeps the handle() it decorates in its closure.
+    for cell in handle.__closure__ or ():
+        if isinstance(cell.cell_contents, FunctionType):
+            handle = cell.cell_contents
+            break
+    namespace = dict(handle.__globals__, MigrationExecutor=executor_class)
+    return FunctionType(handle.__code__, namespace, handle.__name__, handle.__defaults__, handle.__closure__)
+
+
+_cached_migrate_handle = _with_migration_executor(migrate.Command.handle, CachedMigrationExecutor)
+
+
+class CachedMigrateCommand(migrate.Command):
+    """
+    Django's migrate command, running migrations with
+    CachedMigrationExecutor.
+    """
+
+    @no_translations
+    def handle(self, *args, **options):
+        return _cached_migrate_handle(self, *args, **options)
+
+
+@functools.lru_cache(maxsize=None)
+def get_cached_migrate_command_class(command_class):
+    """
+    Returns `command_class`, a subclass of Django's migrate command, with
+    CachedMigrateCommand below it, so that it runs migrations with
+    CachedMigrationExecutor. Other command classes are returned as they are.
+    """
+    if command_class is migrate.Command:
+        return CachedMigrateCommand
+    if not issubclass(command_class, migrate.Command) or issubclass(command_class, CachedMigrateCommand):
+        return command_class
+    return type(command_class.__name__, (command_class, CachedMigrateCommand), {'__module__': command_class.__module__})
@@ -0,0 +1,98 @@
+from django.db import connections
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+
+# Schemas whose django_migrations are read per query.
+SCAN_BATCH_SIZE = 500
+
+
+def _migration_key(app_label, name):
+    return '%s.%s' % (app_label, name)
+
+
+def get_required_migrations(app_label=None):
+    """
+    Returns what migrating to the latest migrations, of `app_label` or of all
+    apps, requires: (migration key, the keys of the migrations it replaces)
+    pairs. Returns None when `app_label` has no migrations.
+    """
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    graph = loader.graph
+    if app_label is None:
+        nodes = graph.nodes
+    else:
+        leaf_nodes = graph.leaf_nodes(app_label)
+        if not leaf_nodes:
+            return None
+        nodes = {node for leaf_node in leaf_nodes for node in graph.forwards_plan(leaf_node)}
+    return [(_migration_key(*node), [_migration_key(*replaced) for replaced in graph.nodes[node].replaces])
+            for node in nodes]
+
+
+def _get_schemas_with_migrations_table(cursor, schema_names):
+    cursor.execute(
+        "SELECT n.nspname FROM pg_catalog.pg_class c "
+        "JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relname = %s AND c.relkind IN ('r', 'p') AND n.nspname = ANY(%s)",
+        (MigrationRecorder.Migration._meta.db_table, list(schema_names)))
+    return {schema_name for schema_name, in cursor.fetchall()}
+
+
+def _scan_applied_migrations(connection, cursor, schema_names, keys, plain):
+    """
+    Returns, for each of `schema_names`, (schema name, the number of `plain`
+    keys applied, the other keys applied), in a single UNION ALL query.
+    """
+    table_name = connection.ops.quote_name(MigrationRecorder.Migration._meta.db_table)
+    selects = []
+    params = [keys, plain]
+    for schema_name in schema_names:
+        selects.append(
+            "SELECT %%s, count(DISTINCT k.key) FILTER (WHERE k.plain), "
+            "array_agg(DISTINCT k.key) FILTER (WHERE NOT k.plain) "
+            "FROM %s.%s m JOIN keys k ON k.key = m.app || '.' || m.name"
+            % (connection.ops.quote_name(schema_name), table_name))
+        params.append(schema_name)
+    cursor.execute(
+        "WITH keys(key, plain) AS (SELECT * FROM unnest(%%s::text[], %%s::boolean[])) %s"
+        % " UNION ALL ".join(selects), params)
+    return cursor.fetchall()
+
+
+def get_schemas_with_unapplied_migrations(schema_names, database, app_label=None):
+    """
+    Returns which of `schema_names` have migrations, of `app_label` or of all
+    apps, left to apply, reading the django_migrations tables of the schemas
+    in batches rather than building a migration plan per schema.
+
+    A schema migrated halfway through the migrations a squashed migration
+    replaces counts as having migrations left. Returns None when `app_label`
+    has no migrations.
+    """
+    required = get_required_migrations(app_label)
+    if required is None:
+        return None
+
+    keys, plain = [], []
+    for key, replaces in required:
+        keys.append(key)
+        plain.append(not replaces)
+        for replaced in replaces:
+            keys.append(replaced)
+            plain.append(False)
+    plain_count = sum(1 for key, replaces in required if not replaces)
+
+    connection = connections[database]
+    unapplied = set(schema_names)
+    with connection.cursor() as cursor:
+        schema_names = sorted(_get_schemas_with_migrations_table(cursor, schema_names))
+        for start in range(0, len(schema_names), SCAN_BATCH_SIZE):
+            batch = schema_names[start:start + SCAN_BATCH_SIZE]
+            for schema_name, applied_plain_count, applied in _scan_applied_migrations(connection, cursor, batch,
+                                                                                      keys, plain):
+                applied = set(applied or ())
+                if applied_plain_count == plain_count and all(
+                        key in applied or applied.issuperset(replaces)
+                        for key, replaces in required if replaces):
+                    unapplied.discard(schema_name)
+    return unapplied
@@ -8,6 +8,7 @@ from django.urls import reverse
 from django_tenants.clone import CloneSchema
 from .postgresql_backend.base import _check_schema_name
 from .signals import post_schema_sync, schema_needs_to_be_sync
+from .tenant_cache import WILDCARD_PREFIX
 from .utils import get_creation_fakes_migrations, get_tenant_base_schema
 from .utils import schema_exists, get_tenant_domain_model, get_public_schema_name, get_tenant_database_alias
 
@@ -268,6 +269,16 @@ class TenantMixin(models.Model):
         """
         return getattr(self, settings.MULTI_TYPE_DATABASE_FIELD)
 
+    def get_db_settings(self):
+        """
+        Get the PostgreSQL settings, such as statement_timeout, work_mem or
+        lock_timeout, to apply while the connection is set to this tenant.
+        They are read when the connection switches to the tenant, and sent
+        along with its search_path.
+        :return: dict
+        """
+        return {}
+
 
 class DomainMixin(models.Model):
     """
@@ -296,3 +307,11 @@ class DomainMixin(models.Model):
 
     def __str__(self):
         return self.domain
+
+    @property
+    def is_wildcard(self):
+        """
+        Whether this is a ``*.example.com`` pattern, matching every subdomain
+        of example.com when ``TENANT_WILDCARD_DOMAINS`` is set.
+        """
+        return self.domain.startswith(WILDCARD_PREFIX)
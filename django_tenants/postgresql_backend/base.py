@@ -6,10 +6,16 @@ from importlib import import_module
 from django.utils.module_loading import import_string
 
 from django_tenants.postgresql_backend.introspection import DatabaseSchemaIntrospection
-from django_tenants.utils import get_public_schema_name, get_limit_set_calls
-from django.contrib.contenttypes.models import ContentType
+from django_tenants.postgresql_backend.compiler import get_schema_qualified_compiler
+from django_tenants.postgresql_backend.content_types import ContentTypeCache
+from django_tenants.postgresql_backend.sql_comment import add_sql_comment, get_sql_comments
+from django_tenants.utils import get_public_schema_name, get_piggyback_search_path, get_transaction_pooling, \
+    get_schema_qualified_tables, get_sql_commenter, has_multi_type_tenants
 from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.utils.asyncio import async_unsafe
+from django.db import transaction
+from django.db.backends import utils as backend_utils
+from django.db.backends.base.base import NO_DB_ALIAS
 import django.db.utils
 
 from django.db.backends.postgresql.psycopg_any import is_psycopg3
@@ -45,6 +51,34 @@ else:
 # https://www.postgresql.org/docs/13/sql-createschema.html
 PGSQL_VALID_SCHEMA_NAME = re.compile(r'^(?!pg_).{1,63}$', re.IGNORECASE)
 
+# Statements `SET search_path` can be sent along with. Sent together, both run
+# in one implicit transaction, which e.g. CREATE DATABASE or VACUUM refuse.
+PIGGYBACK_STATEMENT = re.compile(r'^\s*\(*\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+
+# Attributes of the driver's cursor that send nothing to the server, and so
+# need no search_path.
+NON_EXECUTING_CURSOR_ATTRS = frozenset([
+    'close', 'closed', 'connection', 'name', 'description', 'rowcount', 'rownumber', 'lastrowid', 'arraysize',
+    'itersize', 'statusmessage', 'query', 'pgresult', 'fetchone', 'fetchmany', 'fetchall', 'nextset', 'scroll',
+    'setinputsizes', 'setoutputsize',
+])
+
+# A run-time parameter, or a custom `prefix.name` one.
+DB_SETTING_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$')
+
+# Statements that may change what introspection finds.
+DDL_STATEMENT = re.compile(r'^\s*(CREATE|ALTER|DROP|COMMENT|DO)\b', re.IGNORECASE)
+
+# Statements that may move the session to another search_path, or back to
+# the default one: a SET, set_config(), RESET or DISCARD.
+SEARCH_PATH_STATEMENT = re.compile(r'search_path|\b(RESET|DISCARD)\s+ALL\b', re.IGNORECASE)
+
+# Statements PostgreSQL refuses to run inside a transaction block.
+NO_TRANSACTION_STATEMENT = re.compile(
+    r'^\s*(VACUUM|(CREATE|DROP) (DATABASE|TABLESPACE)|ALTER SYSTEM|(CREATE|DROP|REINDEX)\b.*\bCONCURRENTLY\b)',
+    re.IGNORECASE | re.DOTALL,
+)
+
 
 def is_valid_schema_name(name):
     return PGSQL_VALID_SCHEMA_NAME.match(name)
@@ -55,21 +89,216 @@ def _check_schema_name(name):
         raise ValidationError("Invalid string used for the schema name.")
 
 
+def _search_path_sql(search_paths, local=False):
+    formatted_search_paths = ['\'{}\''.format(s) for s in search_paths]
+    return 'SET {0}search_path = {1}'.format('LOCAL ' if local else '', ','.join(formatted_search_paths))
+
+
+def _get_tenant_type(tenant):
+    return tenant.get_tenant_type() if has_multi_type_tenants() else None
+
+
+def _check_db_setting_name(name):
+    if not DB_SETTING_NAME.match(name):
+        raise ValidationError("Invalid string used for a database setting name.")
+
+
+def _db_settings_sql(db_settings, db_settings_set, local=False):
+    """
+    Returns the statements putting the session on `db_settings`, from
+    `db_settings_set`: those of the latter the former lacks go back to their
+    default.
+    """
+    set_ = 'SET LOCAL' if local else 'SET'
+    statements = ['{0} {1} TO DEFAULT'.format(set_, name) for name in db_settings_set if name not in db_settings]
+    statements.extend('{0} {1} = \'{2}\''.format(set_, name, str(value).replace("'", "''"))
+                      for name, value in db_settings.items())
+    return statements
+
+
+class SearchPathCursorMixin:
+    """
+    Lets a cursor hold back the `SET search_path` issued for it and send it in
+    the same round trip as its first query. See TENANT_PIGGYBACK_SEARCH_PATH.
+    """
+    # The search_path this cursor still has to apply, or None.
+    pending_search_paths = None
+    # With TENANT_TRANSACTION_POOLING, the search_path each transaction, and
+    # so each statement run outside one, has to bring along, or None.
+    statement_search_paths = None
+
+    def apply_search_path(self):
+        """
+        Issue the pending `SET search_path` as a statement of its own.
+        """
+        search_paths, self.pending_search_paths = self.pending_search_paths, None
+        if search_paths is not None and not self.db._is_on_search_path(search_paths):
+            self.db._set_search_path(self, search_paths)
+
+    def _execute_with_wrappers(self, sql, params, many, executor):
+        try:
+            return self._execute_on_search_path(sql, params, many, executor)
+        finally:
+            self.db.forget_search_path(sql)
+
+    def _execute_on_search_path(self, sql, params, many, executor):
+        if self.db.runs_schema_qualified_sql():
+            # Cursors of the ORM's compilers run nothing else.
+            self.pending_search_paths = None
+            return super()._execute_with_wrappers(sql, params, many, executor)
+
+        search_paths = self.statement_search_paths
+        if search_paths is not None:
+            if self.db.get_autocommit():
+                return self._execute_in_transaction(search_paths, sql, params, many, executor)
+            if (self.pending_search_paths is None and not self.db._setting_search_path and
+                    not self.db._is_on_search_path(search_paths)):
+                # Opened outside the transaction it now runs in, which is yet
+                # to have its `SET LOCAL`.
+                self.pending_search_paths = search_paths
+
+        search_paths = self.pending_search_paths
+        if search_paths is None:
+            return super()._execute_with_wrappers(sql, params, many, executor)
+
+        if not get_piggyback_search_path() or not self._can_carry_search_path(sql, many):
+            self.apply_search_path()
+            return super()._execute_with_wrappers(sql, params, many, executor)
+
+        self.pending_search_paths = None
+        if self.db._is_on_search_path(search_paths):
+            return super()._execute_with_wrappers(sql, params, many, executor)
+
+        result = self._execute_with_search_path(search_paths, sql, params, many, executor)
+        self.db._search_path_set(search_paths)
+        return result
+
+    def _execute_in_transaction(self, search_paths, sql, params, many, executor):
+        # Behind a transaction pooler every transaction, and so in autocommit
+        # mode every statement, may run on another server connection: each one
+        # brings a `SET LOCAL search_path` along, which ends with it.
+        if self._can_carry_search_path(sql, many):
+            return self._execute_with_search_path(search_paths, sql, params, many, executor)
+
+        if isinstance(sql, str) and NO_TRANSACTION_STATEMENT.match(sql):
+            return super()._execute_with_wrappers(sql, params, many, executor)
+
+        with transaction.atomic(using=self.db.alias):
+            self.db._set_search_path(self, search_paths)
+            return super()._execute_with_wrappers(sql, params, many, executor)
+
+    def _can_carry_search_path(self, sql, many):
+        # executemany() repeats its statement, a server-side binding cursor only
+        # accepts one statement per query, and some statements cannot run in a
+        # transaction: none of them can be sent along with the SET.
+        return (not many and isinstance(sql, str) and PIGGYBACK_STATEMENT.match(sql) is not None and
+                self.db._can_piggyback_search_path())
+
+    def _execute_with_search_path(self, search_paths, sql, params, many, executor):
+        statements = self.db._get_search_path_statements(search_paths)
+        search_path_sql = '; '.join(statements)
+        if params is not None:
+            search_path_sql = search_path_sql.replace('%', '%%')
+
+        try:
+            result = super()._execute_with_wrappers('%s; %s' % (search_path_sql, sql), params, many, executor)
+        except Exception:
+            # Both statements ran in the same (implicit or aborted) transaction,
+            # so the SET may have been undone with the failing query. The error
+            # raised is the query's own, or the one it would have raised anyway.
+            self.db._search_path_failed()
+            raise
+
+        if is_psycopg3:
+            # psycopg 3 stays on the first result -- the SET's -- until told to
+            # move on; psycopg2 already exposes the last one.
+            for _ in statements:
+                self.cursor.nextset()
+        return result
+
+    def _execute(self, sql, *args):
+        self.db.forget_introspection(sql)
+        return super()._execute(self.db.tag_prepared_statement(sql), *args)
+
+    def _executemany(self, sql, *args):
+        self.db.forget_introspection(sql)
+        return super()._executemany(self.db.tag_prepared_statement(sql), *args)
+
+    def callproc(self, *args, **kwargs):
+        self.apply_search_path()
+        return super().callproc(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        # Anything reaching the driver's cursor without execute() -- copy(),
+        # stream(), ... -- must find the search_path already applied.
+        if self.pending_search_paths is not None and attr not in NON_EXECUTING_CURSOR_ATTRS:
+            self.apply_search_path()
+        return super().__getattr__(attr)
+
+
+class CursorWrapper(SearchPathCursorMixin, backend_utils.CursorWrapper):
+    pass
+
+
+BaseCursorDebugWrapper = getattr(original_backend, 'CursorDebugWrapper', backend_utils.CursorDebugWrapper)
+
+if is_psycopg3:
+    class CursorDebugWrapper(SearchPathCursorMixin, BaseCursorDebugWrapper):
+        def copy(self, statement):
+            self.apply_search_path()
+            return super().copy(statement)
+
+else:
+    class CursorDebugWrapper(SearchPathCursorMixin, BaseCursorDebugWrapper):
+        def copy_expert(self, sql, file, *args):
+            self.apply_search_path()
+            return super().copy_expert(sql, file, *args)
+
+        def copy_to(self, file, table, *args, **kwargs):
+            self.apply_search_path()
+            return super().copy_to(file, table, *args, **kwargs)
+
+
+class DatabaseOperations(original_backend.DatabaseWrapper.ops_class):
+    def compiler(self, compiler_name):
+        compiler = super().compiler(compiler_name)
+        if get_schema_qualified_tables():
+            return get_schema_qualified_compiler(compiler)
+        return compiler
+
+
 class DatabaseWrapper(original_backend.DatabaseWrapper):
     """
     Adds the capability to manipulate the search_path using set_tenant and set_schema_name
     """
     include_public_schema = True
+    ops_class = DatabaseOperations
     # Use a patched version of the DatabaseIntrospection that only returns the table list for the
     # currently selected schema.
 
     def __init__(self, *args, **kwargs):
+        # The search_path last applied to the underlying connection, or None
+        # when it is unknown. A SET is only issued when the wanted path differs.
         self.search_path_set_schemas = None
         # Guards against re-entering _cursor() while we are obtaining a cursor to
         # set the search_path with. See _handle_search_path().
         self._setting_search_path = False
+        # Whether an ORM query compiled with TENANT_SCHEMA_QUALIFIED_TABLES is
+        # running, and whether any of its tables was left for the search_path
+        # to find. See compiler.SchemaQualifiedCompilerMixin.
+        self.executing_schema_qualified_sql = False
+        self.unqualified_tables = False
         self.tenant = None
         self.schema_name = None
+        self.tenant_type = None
+        # The tenant's database settings (see TenantMixin.get_db_settings()),
+        # and those applied to the session along with the search_path. The
+        # latter may name settings already back to their default.
+        self.db_settings = {}
+        self.db_settings_set = {}
+        # With TENANT_SQL_COMMENTER, the comment naming the schema appended to
+        # each statement, as is and for statements with parameters.
+        self.sql_comments = None
         super().__init__(*args, **kwargs)
 
         # Use a patched version of the DatabaseIntrospection that only returns the table list for the
@@ -78,10 +307,107 @@ class DatabaseWrapper(original_backend.DatabaseWrapper):
 
         self.set_schema_to_public()
 
-    def close(self):
+    def make_cursor(self, cursor):
+        return CursorWrapper(cursor, self)
+
+    def make_debug_cursor(self, cursor):
+        return CursorDebugWrapper(cursor, self)
+
+    @property
+    def pool(self):
+        """
+        Builds a TenantConnectionPool where Django would build its psycopg
+        connection pool.
+        """
+        pool_options = self.settings_dict['OPTIONS'].get('pool')
+        if (not is_psycopg3 or not pool_options or not hasattr(original_backend.DatabaseWrapper, 'pool') or
+                self.alias == NO_DB_ALIAS or
+                self.alias in self._connection_pools or self.settings_dict.get('CONN_MAX_AGE', 0) != 0):
+            # Nothing to build, or let Django complain about it.
+            return getattr(super(), 'pool', None)
+
+        try:
+            from django_tenants.postgresql_backend.pool import TenantConnectionPool
+        except ImportError:
+            return super().pool
+
+        connect_kwargs = self.get_connection_params()
+        # Ensure we run in autocommit, Django properly sets it later on.
+        connect_kwargs['autocommit'] = True
+        enable_checks = self.settings_dict['CONN_HEALTH_CHECKS']
+        pool = TenantConnectionPool(
+            kwargs=connect_kwargs,
+            open=False,  # Do not open the pool during startup.
+            configure=self._configure_connection,
+            check=TenantConnectionPool.check_connection if enable_checks else None,
+            **({} if pool_options is True else pool_options),
+        )
+        self._connection_pools.setdefault(self.alias, pool)
+        return self._connection_pools[self.alias]
+
+    def init_connection_state(self):
+        # A named cursor runs one statement per round trip, so it cannot bring
+        # a `SET LOCAL` along with its query in autocommit mode.
+        if get_transaction_pooling() and not self.settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+            raise ImproperlyConfigured("TENANT_TRANSACTION_POOLING requires DISABLE_SERVER_SIDE_CURSORS to be "
+                                       "set for the database %r." % self.alias)
+        super().init_connection_state()
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        # Not a connection parameter, see get_new_connection().
+        conn_params.pop('prepared_max', None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        # A fresh connection may be on any search_path. One from a
+        # TenantConnectionPool is on the path it was returned on, which is
+        # preferably the one the current tenant needs.
         self.search_path_set_schemas = None
-        self._setting_search_path = False
-        super().close()
+        self.db_settings_set = {}
+        pool = self.pool if is_psycopg3 else None
+        if not hasattr(pool, 'request'):
+            connection = super().get_new_connection(conn_params)
+        else:
+            search_paths = self._get_cursor_search_paths()
+            pool.request(search_paths, None if self.schema_name == get_public_schema_name() else self.schema_name)
+            connection = super().get_new_connection(conn_params)
+            self.search_path_set_schemas = pool.get_search_paths(connection)
+            self.db_settings_set = pool.get_db_settings(connection)
+
+        # Each schema gets prepared statements of its own (see
+        # tag_prepared_statement()), so more of them may be worth keeping.
+        prepared_max = self.settings_dict['OPTIONS'].get('prepared_max')
+        if is_psycopg3 and prepared_max is not None:
+            connection.prepared_max = prepared_max
+        return connection
+
+    def _close(self):
+        if self.connection is not None and hasattr(getattr(self.connection, '_pool', None), 'set_search_paths'):
+            self.connection._pool.set_search_paths(self.connection, self.search_path_set_schemas,
+                                                   self.db_settings_set)
+        return super()._close()
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.search_path_set_schemas = None
+            self._setting_search_path = False
+            self.introspection.clear_cache()
+
+    @async_unsafe
+    def commit(self):
+        # A `SET LOCAL` ends with the transaction that issued it.
+        if get_transaction_pooling():
+            self.search_path_set_schemas = None
+        super().commit()
+
+    def _set_autocommit(self, autocommit):
+        # Switching autocommit on or off ends the transaction too.
+        if get_transaction_pooling():
+            self.search_path_set_schemas = None
+        super()._set_autocommit(autocommit)
 
     @async_unsafe
     def rollback(self):
@@ -91,45 +417,94 @@ class DatabaseWrapper(original_backend.DatabaseWrapper):
         # database has already discarded.
         self.search_path_set_schemas = None
         self._setting_search_path = False
+        # DDL is rolled back too.
+        self.introspection.clear_cache()
         super().rollback()
 
+    def _savepoint_rollback(self, sid):
+        # As with rollback(), a SET issued after the savepoint is undone with it.
+        # The cursor rolling back needs no search_path of its own.
+        self._setting_search_path = True
+        try:
+            super()._savepoint_rollback(sid)
+        finally:
+            self._setting_search_path = False
+            self.search_path_set_schemas = None
+            self.introspection.clear_cache()
+
     def set_tenant(self, tenant, include_public=True):
         """
         Main API method to current database schema,
         but it does not actually modify the db connection.
         """
+        if include_public == self.include_public_schema and self._is_current_tenant(tenant):
+            # Already there: switching would only redo the same work.
+            return
+
+        get_db_settings = getattr(tenant, 'get_db_settings', None)
+        db_settings = dict(get_db_settings()) if get_db_settings is not None else {}
+        for name in db_settings:
+            _check_db_setting_name(name)
+
         self.tenant = tenant
         self.schema_name = tenant.schema_name
+        self.tenant_type = _get_tenant_type(tenant)
         self.include_public_schema = include_public
+        self.db_settings = db_settings
         self.set_settings_schema(self.schema_name)
 
         if EXTRA_SET_TENANT_METHOD:
             EXTRA_SET_TENANT_METHOD(self, tenant)
 
-        self.search_path_set_schemas = None
+        if get_sql_commenter():
+            self.sql_comments = get_sql_comments(self.schema_name)
+            if self.comment_sql not in self.execute_wrappers:
+                # First, so that execute_wrapper() blocks still pop their own.
+                self.execute_wrappers.insert(0, self.comment_sql)
+        else:
+            self.sql_comments = None
+
+        # Content types are cached per schema, as a model's content type can
+        # have a different id in the public schema than in the tenants'. See
+        # ContentTypeCache.
+        ContentTypeCache.install()
 
-        # Content type can no longer be cached as public and tenant schemas
-        # have different models. If someone wants to change this, the cache
-        # needs to be separated between public and shared schemas. If this
-        # cache isn't cleared, this can cause permission problems. For example,
-        # on public, a particular model has id 14, but on the tenants it has
-        # the id 15. if 14 is cached instead of 15, the permissions for the
-        # wrong model will be fetched.
-        ContentType.objects.clear_cache()
+    def comment_sql(self, execute, sql, params, many, context):
+        """
+        An execute wrapper appending the comment naming the current schema to
+        each statement, so that the tenant running it shows in logs and
+        pg_stat_statements. See sql_comment.strip_sql_comment().
+        """
+        sql_comments = self.sql_comments
+        if sql_comments is not None and isinstance(sql, str):
+            sql = add_sql_comment(sql, sql_comments[params is not None])
+        return execute(sql, params, many, context)
+
+    def _is_current_tenant(self, tenant):
+        # The current tenant may have been renamed, or changed type, since
+        # it was set: compare against what the connection was set to.
+        if tenant.schema_name != self.schema_name or _get_tenant_type(tenant) != self.tenant_type:
+            return False
+        current = self.tenant
+        # FakeTenants are nothing but their schema name and tenant type.
+        return tenant is current or (type(tenant) is FakeTenant and type(current) is FakeTenant)
 
     def set_schema(self, schema_name, include_public=True, tenant_type=None):
         """
         Main API method to current database schema,
         but it does not actually modify the db connection.
         """
-        self.set_tenant(FakeTenant(schema_name=schema_name,
-                                   tenant_type=tenant_type), include_public)
+        if schema_name == get_public_schema_name() and tenant_type is None:
+            tenant = FakeTenant.public()
+        else:
+            tenant = FakeTenant(schema_name=schema_name, tenant_type=tenant_type)
+        self.set_tenant(tenant, include_public)
 
     def set_schema_to_public(self):
         """
         Instructs to stay in the common 'public' schema.
         """
-        self.set_tenant(FakeTenant(schema_name=get_public_schema_name()))
+        self.set_tenant(FakeTenant.public())
 
     def set_settings_schema(self, schema_name):
         self.settings_dict['SCHEMA'] = schema_name
@@ -156,7 +531,9 @@ class DatabaseWrapper(original_backend.DatabaseWrapper):
             cursor = super()._cursor()
 
         # A named cursor can only execute one statement, so it cannot carry the
-        # `SET search_path` and we have to open a throwaway cursor for it. An
+        # `SET search_path` and we have to open a throwaway cursor for it --
+        # unless the connection is already on the path, which is then known
+        # without a round trip or a cursor from `search_path_set_schemas`. An
         # unnamed one can, and reusing it keeps the statement visible to Django's
         # cursor wrapper -- and therefore to assertNumQueries -- on every driver.
         self._handle_search_path(cursor if name is None else None)
@@ -178,17 +555,47 @@ class DatabaseWrapper(original_backend.DatabaseWrapper):
         if self._setting_search_path:
             return
 
-        # optionally limit the number of executions - under load, the execution
-        # of `set search_path` can be quite time consuming
-        if get_limit_set_calls() and self.search_path_set_schemas:
-            return
-
         if not self.schema_name:
             raise ImproperlyConfigured("Database schema not set. Did you forget "
                                        "to call set_schema() or set_tenant()?")
 
         search_paths = self._get_cursor_search_paths()
 
+        # A named cursor is only opened once its query is compiled.
+        if cursor is None and self.runs_schema_qualified_sql():
+            return
+
+        # A `SET LOCAL` ends with its transaction, so the cursor brings one
+        # into each transaction it runs in. Outside one it would not outlive
+        # the statement sending it: each statement then sends its own. Named
+        # cursors are refused with transaction pooling, see
+        # init_connection_state().
+        if get_transaction_pooling():
+            if isinstance(cursor, SearchPathCursorMixin):
+                cursor.statement_search_paths = search_paths
+            if self.get_autocommit():
+                return
+
+        # The connection is already on this path; under load, the execution of
+        # `set search_path` can be quite time consuming.
+        if self._is_on_search_path(search_paths):
+            return
+
+        # Rather than spend a round trip on the SET now, leave it to the cursor
+        # to send along with its first query, or to skip if that query names
+        # the schema of each of its tables.
+        if isinstance(cursor, SearchPathCursorMixin) and (get_piggyback_search_path() or
+                                                          get_schema_qualified_tables()):
+            cursor.pending_search_paths = search_paths
+            return
+
+        self._set_search_path(cursor, search_paths)
+
+    def _set_search_path(self, cursor, search_paths):
+        """
+        Execute `SET search_path` for `search_paths` on `cursor`, or on a
+        throwaway cursor if it is None, and remember it as applied.
+        """
         self._setting_search_path = True
         cursor_for_search_path = self.connection.cursor() if cursor is None else cursor
 
@@ -197,17 +604,96 @@ class DatabaseWrapper(original_backend.DatabaseWrapper):
         # if the next instruction is not a rollback it will just fail also, so
         # we do not have to worry that it's not the good one
         try:
-            formatted_search_paths = ['\'{}\''.format(s) for s in search_paths]
-            cursor_for_search_path.execute('SET search_path = {0}'.format(','.join(formatted_search_paths)))
+            if self._can_piggyback_search_path():
+                cursor_for_search_path.execute(self._get_search_path_sql(search_paths))
+            else:
+                for statement in self._get_search_path_statements(search_paths):
+                    cursor_for_search_path.execute(statement)
         except (django.db.utils.DatabaseError, psycopg.InternalError):
-            self.search_path_set_schemas = None
+            self._search_path_failed()
         else:
-            self.search_path_set_schemas = search_paths
+            self._search_path_set(search_paths)
         finally:
             self._setting_search_path = False
             if cursor is None:
                 cursor_for_search_path.close()
 
+    def forget_search_path(self, sql):
+        """
+        Forgets the search_path applied to the connection if `sql`, not sent
+        by us, may have changed it.
+        """
+        if (not self._setting_search_path and self.search_path_set_schemas is not None and
+                isinstance(sql, str) and SEARCH_PATH_STATEMENT.search(sql)):
+            self._search_path_failed()
+
+    def forget_introspection(self, sql):
+        """
+        Drops the cached introspection results if `sql` may change them.
+        """
+        if self.introspection._cache and isinstance(sql, str) and DDL_STATEMENT.match(sql):
+            self.introspection.clear_cache()
+
+    def tag_prepared_statement(self, sql):
+        """
+        Prefixes `sql` with a comment naming the search_path it runs on when
+        psycopg prepares statements, so that it prepares one per path.
+
+        PostgreSQL re-parses and re-plans a prepared statement whenever it runs
+        on another search_path than the last time; with a statement per path,
+        tenants taking turns on the connection no longer undo each other's plans.
+        """
+        search_paths = self.search_path_set_schemas
+        if (search_paths is None or self._setting_search_path or not isinstance(sql, str) or
+                not self._prepares_statements() or self.runs_schema_qualified_sql()):
+            return sql
+        # A comment in a schema name must not end ours, or open one.
+        return '/* %s */ %s' % (','.join(search_paths).replace('*', '').replace('/', ''), sql)
+
+    def _prepares_statements(self):
+        # psycopg only prepares statements it binds server-side.
+        options = self.settings_dict['OPTIONS']
+        return (is_psycopg3 and options.get('server_side_binding') is True and
+                options.get('prepare_threshold') is not None)
+
+    def runs_schema_qualified_sql(self):
+        """
+        Whether the query running names the schema of each of its tables, and
+        so needs no search_path.
+        """
+        return self.executing_schema_qualified_sql and not self.unqualified_tables
+
+    def _get_search_path_sql(self, search_paths):
+        return '; '.join(self._get_search_path_statements(search_paths))
+
+    def _get_search_path_statements(self, search_paths):
+        # Behind a transaction pooler the path must not outlive the transaction,
+        # or it would leak to whichever client gets the server connection next.
+        # Nor then do the tenant's settings, which need no resetting either.
+        local = get_transaction_pooling()
+        statements = [_search_path_sql(search_paths, local=local)]
+        if self.db_settings or (self.db_settings_set and not local):
+            statements.extend(_db_settings_sql(self.db_settings, {} if local else self.db_settings_set, local=local))
+        return statements
+
+    def _is_on_search_path(self, search_paths):
+        # The tenant's settings go along with its search_path.
+        return search_paths == self.search_path_set_schemas and self.db_settings == self.db_settings_set
+
+    def _search_path_set(self, search_paths):
+        self.search_path_set_schemas = search_paths
+        self.db_settings_set = self.db_settings
+
+    def _search_path_failed(self):
+        # The settings may or may not have been applied: reset them all next time.
+        self.search_path_set_schemas = None
+        self.db_settings_set = {**self.db_settings_set, **self.db_settings}
+
+    def _can_piggyback_search_path(self):
+        # psycopg 3's server-side binding uses the extended query protocol,
+        # which takes a single statement per query.
+        return not (is_psycopg3 and self.settings_dict['OPTIONS'].get('server_side_binding') is True)
+
     def _get_cursor_search_paths(self):
         public_schema_name = get_public_schema_name()
 
@@ -233,9 +719,25 @@ class FakeTenant:
     We can't import any db model in a backend (apparently?), so this class is used
     for wrapping schema names in a tenant-like structure.
     """
+    __slots__ = ('schema_name', 'tenant_type')
+
+    _public = None
+
     def __init__(self, schema_name, tenant_type=None):
         self.schema_name = schema_name
         self.tenant_type = tenant_type
 
     def get_tenant_type(self):
         return self.tenant_type
+
+    @classmethod
+    def public(cls):
+        """
+        Returns the FakeTenant of the public schema, shared by every caller:
+        FakeTenants are never modified.
+        """
+        public = cls._public
+        public_schema_name = get_public_schema_name()
+        if public is None or public.schema_name != public_schema_name:
+            public = cls._public = cls(schema_name=public_schema_name)
+        return public
@@ -0,0 +1,120 @@
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models.expressions import RawSQL
+from django.db.models.sql.compiler import SQLInsertCompiler
+from django.db.models.sql.where import ExtraWhere
+
+from django_tenants.utils import get_public_schema_name, get_tenant_types, has_multi_type_tenants
+
+
+@lru_cache(maxsize=None)
+def _get_app_tables(apps_list):
+    """
+    Returns the tables of the models in the apps of `apps_list`, as
+    TenantSyncRouter decides app membership.
+    """
+    from django_tenants.routers import TenantSyncRouter
+
+    router = TenantSyncRouter()
+    return frozenset(model._meta.db_table
+                     for model in apps.get_models(include_auto_created=True)
+                     if router.app_in_list(model._meta.app_label, apps_list))
+
+
+def get_table_schema_name(connection, table_name):
+    """
+    Returns the schema holding `table_name` for the connection's current
+    tenant: the tenant's own schema for a tenant app's table, the public one
+    for a shared app's, or None for a table of neither.
+    """
+    public_schema_name = get_public_schema_name()
+    if has_multi_type_tenants():
+        tenant_types = get_tenant_types()
+        shared_apps = tenant_types[public_schema_name]['APPS']
+        if connection.schema_name != public_schema_name:
+            tenant_apps = tenant_types[connection.tenant.get_tenant_type()]['APPS']
+    else:
+        shared_apps = settings.SHARED_APPS
+        tenant_apps = settings.TENANT_APPS
+
+    if connection.schema_name != public_schema_name and table_name in _get_app_tables(tuple(tenant_apps)):
+        return connection.schema_name
+    if table_name in _get_app_tables(tuple(shared_apps)):
+        return public_schema_name
+    return None
+
+
+class SchemaQualifiedCompilerMixin:
+    """
+    Writes the tables of the query as `"schema"."table"`, so that it runs
+    the same whatever the connection's search_path.
+    """
+
+    def quote_name_unless_alias(self, name):
+        if name in self.quote_cache:
+            return self.quote_cache[name]
+
+        r = super().quote_name_unless_alias(name)
+        # Columns are quoted through here too: only tables get a schema.
+        if name in self.query.table_map:
+            r = self.quote_cache[name] = self.qualify_table_name(name, r)
+        return r
+
+    def qualify_table_name(self, name, quoted_name):
+        """
+        Returns `quoted_name`, the quoted table `name`, prefixed with its schema.
+        """
+        schema_name = get_table_schema_name(self.connection, name)
+        if schema_name is None:
+            # Not ours to place: let the search_path find it.
+            self.connection.unqualified_tables = True
+            return quoted_name
+        return '%s.%s' % (self.connection.ops.quote_name(schema_name), quoted_name)
+
+    def compile(self, node):
+        # Raw SQL may name tables of its own.
+        if isinstance(node, (RawSQL, ExtraWhere)):
+            self.connection.unqualified_tables = True
+        return super().compile(node)
+
+    def as_sql(self, *args, **kwargs):
+        if self.query.extra_select or self.query.extra_tables:
+            self.connection.unqualified_tables = True
+        return super().as_sql(*args, **kwargs)
+
+    def execute_sql(self, *args, **kwargs):
+        connection = self.connection
+        if connection.executing_schema_qualified_sql:
+            return super().execute_sql(*args, **kwargs)
+
+        connection.executing_schema_qualified_sql = True
+        connection.unqualified_tables = False
+        try:
+            return super().execute_sql(*args, **kwargs)
+        finally:
+            connection.executing_schema_qualified_sql = False
+
+
+class SchemaQualifiedInsertCompilerMixin(SchemaQualifiedCompilerMixin):
+    def as_sql(self, *args, **kwargs):
+        # The insert compiler quotes its table without quote_name_unless_alias().
+        table = self.query.get_meta().db_table
+        quoted_table = self.connection.ops.quote_name(table)
+        qualified_table = self.qualify_table_name(table, quoted_table)
+        return [(sql.replace(quoted_table, qualified_table, 1), params)
+                for sql, params in super().as_sql(*args, **kwargs)]
+
+
+@lru_cache(maxsize=None)
+def get_schema_qualified_compiler(compiler):
+    """
+    Returns a subclass of the compiler class `compiler` that schema-qualifies
+    the tables of the queries it compiles.
+    """
+    if issubclass(compiler, SQLInsertCompiler):
+        mixin = SchemaQualifiedInsertCompilerMixin
+    else:
+        mixin = SchemaQualifiedCompilerMixin
+    return type(compiler.__name__, (mixin, compiler), {})
@@ -0,0 +1,71 @@
+import threading
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections
+
+from django_tenants.postgresql_backend.compiler import get_table_schema_name
+from django_tenants.utils import get_content_type_cache_size, get_public_schema_name, has_multi_type_tenants
+
+
+def get_content_type_schema_name(connection):
+    """
+    Returns the schema whose django_content_type table the connection's
+    current tenant reads: its own if contenttypes is one of its apps, the
+    public one if it is only shared.
+    """
+    schema_name = connection.schema_name
+    if schema_name is None or schema_name == get_public_schema_name():
+        return schema_name
+    if has_multi_type_tenants() and connection.tenant.get_tenant_type() is None:
+        # The tenant's apps are unknown: its own schema is always safe.
+        return schema_name
+    return get_table_schema_name(connection, ContentType._meta.db_table) or schema_name
+
+
+class ContentTypeCache(dict):
+    """
+    Stands in for ContentTypeManager's cache, a dict of per-database dicts,
+    and keeps one of those per database and schema instead: a model's content
+    type can have a different id in each schema with a django_content_type
+    table of its own. Tenants sharing the public table share its entries.
+
+    Only the `get_content_type_cache_size()` schemas cached last are kept.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+
+    def _key(self, using):
+        return using, get_content_type_schema_name(connections[using])
+
+    def __getitem__(self, using):
+        return super().__getitem__(self._key(using))
+
+    def __contains__(self, using):
+        return super().__contains__(self._key(using))
+
+    def get(self, using, default=None):
+        return super().get(self._key(using), default)
+
+    def setdefault(self, using, default=None):
+        key = self._key(using)
+        size = get_content_type_cache_size()
+        with self._lock:
+            if key not in self.keys():
+                while self and len(self) >= size:
+                    del self[next(iter(self))]
+            return super().setdefault(key, default)
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+
+    @classmethod
+    def install(cls):
+        """
+        Makes ContentType's manager cache content types per schema.
+        """
+        manager = ContentType.objects
+        if not isinstance(manager._cache, cls):
+            manager._cache = cls()
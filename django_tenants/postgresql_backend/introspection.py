@@ -1,59 +1,112 @@
-# Import the backend's base module before its introspection module. On Django 6.1
-# `django.db.backends.postgresql.introspection` imports `psycopg_version` from
-# `...postgresql.base`, which in turn imports `...postgresql.introspection` -- so
-# importing introspection first leaves base half-initialised and the cycle raises
-# ImportError. Django itself never hits this because base is always imported first.
-import django.db.backends.postgresql.base  # noqa: F401
-from django.db.backends.postgresql.introspection import DatabaseIntrospection
-
-
-class DatabaseSchemaIntrospectionSearchPathContext:
-    """
-    This context manager restores the original search path of the cursor
-    once the method of the introspection class has been called.
-    """
-    def __init__(self, cursor, connection):
-        self.cursor = cursor
-        self.connection = connection
-        self.original_search_path = None
-
-    def __enter__(self):
-        self.cursor.execute('SHOW search_path')
-        self.original_search_path = [
-            search_path.strip().replace('"', '')
-            for search_path in self.cursor.fetchone()[0].split(',')
-        ]
-        self.cursor.execute(f"SET search_path = '{self.connection.schema_name}'")
-
-    def __exit__(self, *args, **kwargs):
-        formatted_search_paths = ', '.join(
-            f"'{search_path}'"
-            for search_path in self.original_search_path
-        )
-        self.cursor.execute(f'SET search_path = {formatted_search_paths}')
-
-
-class DatabaseSchemaIntrospection(DatabaseIntrospection):
-    """
-    database schema introspection class
-    """
-
-    def get_table_list(self, cursor):
-        with DatabaseSchemaIntrospectionSearchPathContext(cursor=cursor, connection=self.connection):
-            return super().get_table_list(cursor)
-
-    def get_table_description(self, cursor, table_name):
-        with DatabaseSchemaIntrospectionSearchPathContext(cursor=cursor, connection=self.connection):
-            return super().get_table_description(cursor, table_name)
-
-    def get_sequences(self, cursor, table_name, table_fields=()):
-        with DatabaseSchemaIntrospectionSearchPathContext(cursor=cursor, connection=self.connection):
-            return super().get_sequences(cursor, table_name, table_fields)
-
-    def get_key_columns(self, cursor, table_name):
-        with DatabaseSchemaIntrospectionSearchPathContext(cursor=cursor, connection=self.connection):
-            return super().get_key_columns(cursor, table_name)
-
-    def get_constraints(self, cursor, table_name):
-        with DatabaseSchemaIntrospectionSearchPathContext(cursor=cursor, connection=self.connection):
-            return super().get_constraints(cursor, table_name)
+# Import the backend's base module before its introspection module. On Django 6.1
+# `django.db.backends.postgresql.introspection` imports `psycopg_version` from
+# `...postgresql.base`, which in turn imports `...postgresql.introspection` -- so
+# importing introspection first leaves base half-initialised and the cycle raises
+# ImportError. Django itself never hits this because base is always imported first.
+import django.db.backends.postgresql.base  # noqa: F401
+
+import copy
+import re
+
+from django.db import NotSupportedError
+from django.db.backends.postgresql.introspection import DatabaseIntrospection
+
+from django_tenants.utils import get_introspection_cache
+
+# How Django's introspection queries keep to the tables on the search_path.
+TABLE_IS_VISIBLE = re.compile(r'(?:pg_catalog\.)?pg_table_is_visible\((\w+)\.oid\)')
+# How get_table_description() reads the columns of a table.
+SELECT_FROM_TABLE = re.compile(r'^SELECT \* FROM ("[^"]+") LIMIT 1$')
+
+
+class SchemaScopedCursor:
+    """
+    Wraps the cursor Django's introspection queries run on, so that they look
+    at the tables of a single schema, named in the queries, rather than at
+    those visible on the search_path. That spares setting the search_path to
+    the schema and back around each of them. A query it doesn't know how to
+    scope raises NotSupportedError rather than run unscoped.
+    """
+
+    def __init__(self, cursor, connection, schema_name):
+        self.cursor = cursor
+        self.connection = connection
+        self.schema_name = schema_name
+
+    def execute(self, sql, params=None):
+        args = list(params or ())
+        scoped_sql = []
+        scoped_params = []
+        start = taken = 0
+        for match in TABLE_IS_VISIBLE.finditer(sql):
+            text = sql[start:match.start()]
+            count = text.count('%s')
+            scoped_params.extend(args[taken:taken + count])
+            taken += count
+            scoped_sql.append(text)
+            scoped_sql.append('%s.relnamespace = (SELECT oid FROM pg_catalog.pg_namespace WHERE nspname = %%s)'
+                              % match.group(1))
+            scoped_params.append(self.schema_name)
+            start = match.end()
+
+        if scoped_sql:
+            scoped_sql.append(sql[start:])
+            scoped_params.extend(args[taken:])
+            return self.cursor.execute(''.join(scoped_sql), scoped_params)
+
+        match = SELECT_FROM_TABLE.match(sql)
+        if match is None:
+            # Run as is, the query would describe whatever the search_path
+            # shows -- the public schema's tables included.
+            raise NotSupportedError(
+                "Cannot scope this introspection query to schema '%s': %s" % (self.schema_name, sql))
+        sql = 'SELECT * FROM %s.%s LIMIT 1' % (self.connection.ops.quote_name(self.schema_name), match.group(1))
+        return self.cursor.execute(sql, params)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+
+class DatabaseSchemaIntrospection(DatabaseIntrospection):
+    """
+    Introspects the schema of the connection's current tenant only.
+
+    With ``TENANT_INTROSPECTION_CACHE``, results are cached per schema until
+    the connection runs DDL, rolls back or closes. See clear_cache().
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache = {}
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def _introspect(self, method, cursor, *args, key=None):
+        schema_name = self.connection.schema_name
+        cursor = SchemaScopedCursor(cursor, self.connection, schema_name)
+        if not get_introspection_cache():
+            return method(cursor, *args)
+
+        key = (schema_name, method.__name__, key or args)
+        try:
+            result = self._cache[key]
+        except KeyError:
+            result = self._cache[key] = method(cursor, *args)
+        # Callers may modify what they get.
+        return copy.deepcopy(result)
+
+    def get_table_list(self, cursor):
+        return self._introspect(super().get_table_list, cursor)
+
+    def get_table_description(self, cursor, table_name):
+        return self._introspect(super().get_table_description, cursor, table_name)
+
+    def get_sequences(self, cursor, table_name, table_fields=()):
+        return self._introspect(super().get_sequences, cursor, table_name, table_fields, key=(table_name,))
+
+    def get_relations(self, cursor, table_name):
+        return self._introspect(super().get_relations, cursor, table_name)
+
+    def get_constraints(self, cursor, table_name):
+        return self._introspect(super().get_constraints, cursor, table_name)
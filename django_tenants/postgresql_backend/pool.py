@@ -0,0 +1,147 @@
+import threading
+import weakref
+from time import monotonic
+
+from psycopg.pq import TransactionStatus
+from psycopg_pool import ConnectionPool, PoolTimeout
+
+
+class TenantConnectionPool(ConnectionPool):
+    """
+    A psycopg connection pool that remembers the search_path each idle
+    connection was left on, and hands out one already on the path asked for
+    when it has one, sparing the `SET search_path`.
+
+    `max_tenant_size` caps the connections a single tenant can hold at once,
+    so that one busy tenant cannot take the whole pool. The public schema is
+    not capped.
+
+    The preference relies on psycopg_pool's internal `_pool` deque of idle
+    connections and `_get_ready_connection()` hook.
+    """
+
+    def __init__(self, *args, max_tenant_size=None, **kwargs):
+        self.max_tenant_size = max_tenant_size
+        # Idle connection -> the search_path it was returned on.
+        self._search_paths = weakref.WeakKeyDictionary()
+        # Connection -> the database settings its borrowers applied.
+        self._db_settings = weakref.WeakKeyDictionary()
+        # Borrowed connection -> the tenant it counts against.
+        self._borrowers = weakref.WeakKeyDictionary()
+        self._tenant_sizes = {}
+        self._tenant_condition = threading.Condition()
+        # What the thread calling getconn() asks for. See request().
+        self._request = threading.local()
+        super().__init__(*args, **kwargs)
+
+    def request(self, search_paths, tenant=None):
+        """
+        Sets what the next getconn() of this thread asks for: a connection on
+        `search_paths`, counted against `tenant` for `max_tenant_size`.
+        """
+        self._request.search_paths = search_paths
+        self._request.tenant = tenant
+
+    def get_search_paths(self, conn):
+        """
+        Returns the search_path `conn` was returned to the pool on, or None
+        if it is unknown.
+        """
+        return self._search_paths.get(conn)
+
+    def get_db_settings(self, conn):
+        """
+        Returns the database settings borrowers of `conn` applied to it. Some
+        may have been rolled back since.
+        """
+        return dict(self._db_settings.get(conn, {}))
+
+    def set_search_paths(self, conn, search_paths, db_settings=None):
+        """
+        Records the search_path `conn`, about to be returned, was left on, and
+        the database settings applied to it.
+        """
+        if search_paths is None:
+            self._search_paths.pop(conn, None)
+        else:
+            self._search_paths[conn] = list(search_paths)
+        if db_settings:
+            self._db_settings[conn] = dict(db_settings)
+        else:
+            self._db_settings.pop(conn, None)
+
+    def getconn(self, timeout=None):
+        search_paths = getattr(self._request, 'search_paths', None)
+        tenant = getattr(self._request, 'tenant', None)
+        self._request.search_paths = self._request.tenant = None
+
+        if timeout is None:
+            timeout = self.timeout
+        deadline = monotonic() + timeout
+
+        if self.max_tenant_size and tenant is not None:
+            self._acquire_tenant_slot(tenant, deadline, timeout)
+
+        self._request.wanted_search_paths = search_paths
+        try:
+            conn = super().getconn(max(deadline - monotonic(), 0.0))
+        except BaseException:
+            if self.max_tenant_size and tenant is not None:
+                self._release_tenant_slot(tenant)
+            raise
+        finally:
+            self._request.wanted_search_paths = None
+
+        if self.max_tenant_size and tenant is not None:
+            self._borrowers[conn] = tenant
+        return conn
+
+    def putconn(self, conn):
+        tenant = self._borrowers.pop(conn, None)
+        try:
+            super().putconn(conn)
+        finally:
+            if tenant is not None:
+                self._release_tenant_slot(tenant)
+
+    def _acquire_tenant_slot(self, tenant, deadline, timeout):
+        with self._tenant_condition:
+            while self._tenant_sizes.get(tenant, 0) >= self.max_tenant_size:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        "tenant %r already holds %d connections of the pool after %.2f sec"
+                        % (tenant, self.max_tenant_size, timeout))
+                self._tenant_condition.wait(remaining)
+            self._tenant_sizes[tenant] = self._tenant_sizes.get(tenant, 0) + 1
+
+    def _release_tenant_slot(self, tenant):
+        with self._tenant_condition:
+            size = self._tenant_sizes.get(tenant, 0) - 1
+            if size > 0:
+                self._tenant_sizes[tenant] = size
+            else:
+                self._tenant_sizes.pop(tenant, None)
+            # Waiters for every tenant share the condition: wake them all, as
+            # waking a single one may wake one waiting for another tenant.
+            self._tenant_condition.notify_all()
+
+    def _get_ready_connection(self, timeout):
+        # Called with the pool locked: prefer an idle connection already on
+        # the search_path asked for, if there is one.
+        search_paths = getattr(self._request, 'wanted_search_paths', None)
+        if search_paths is not None and self._pool and (timeout is None or timeout > 0.0):
+            for conn in self._pool:
+                if self._search_paths.get(conn) == search_paths:
+                    self._pool.remove(conn)
+                    if len(self._pool) < self._nconns_min:
+                        self._nconns_min = len(self._pool)
+                    return conn
+        return super()._get_ready_connection(timeout)
+
+    def _reset_connection(self, conn):
+        # Rolling a transaction back, or a reset function, may change the
+        # search_path the connection was returned on.
+        if self._reset or conn.pgconn.transaction_status != TransactionStatus.IDLE:
+            self._search_paths.pop(conn, None)
+        super()._reset_connection(conn)
@@ -0,0 +1,36 @@
+import re
+from functools import lru_cache
+from urllib.parse import quote
+
+# A comment get_sql_comments() appended, wherever it ended up in the statement.
+SQL_COMMENT = re.compile(r"\s?/\*schema_name='[^'*]*'\*/")
+
+
+@lru_cache(maxsize=None)
+def get_sql_comments(schema_name):
+    """
+    Returns the sqlcommenter-style comment naming `schema_name` that is
+    appended to statements, as is and with its `%` escaped for statements
+    that have parameters.
+    """
+    value = quote(schema_name, safe='').replace("'", "\\'")
+    comment = " /*schema_name='%s'*/" % value
+    return comment, comment.replace('%', '%%')
+
+
+def add_sql_comment(sql, comment):
+    """
+    Appends `comment` to `sql`, before its final semicolon if it has one.
+    """
+    if sql[-1:] == ';':
+        return sql[:-1] + comment + ';'
+    return sql + comment
+
+
+def strip_sql_comment(sql):
+    """
+    Returns `sql` without the comment naming the schema it ran on, so that
+    the statements of all tenants can be grouped together, in slow query
+    logs or pg_stat_statements.query for instance.
+    """
+    return SQL_COMMENT.sub('', sql)
@@ -0,0 +1,80 @@
+from functools import lru_cache
+
+from django.core import signing
+from django.core.exceptions import PermissionDenied
+from django.utils.module_loading import import_string
+
+from django_tenants.utils import (
+    get_tenant_header,
+    get_tenant_resolver_paths,
+    get_tenant_token_header,
+    get_tenant_token_max_age,
+)
+
+TENANT_TOKEN_SALT = 'django_tenants.resolvers.SignedTokenTenantResolver'
+
+
+class TenantResolver:
+    """
+    Base class for the resolvers listed in ``TENANT_RESOLVERS``. The tenant
+    middleware asks each in turn for the schema name of the request's tenant,
+    before falling back to the hostname or subfolder.
+
+    Resolvers only read the request. The tenant itself is looked up by the
+    middleware through the tenant caches, so a resolver never costs a query
+    once the tenant is cached.
+    """
+
+    def get_schema_name(self, request):
+        """
+        Returns the schema name of the request's tenant, or None to leave the
+        request to the next resolver.
+        """
+        raise NotImplementedError
+
+
+class HeaderTenantResolver(TenantResolver):
+    """
+    Takes the schema name from the ``TENANT_HEADER`` request header.
+
+    Anybody able to reach the application can send that header, so only use
+    this where a proxy strips it from outside requests.
+    """
+
+    def get_schema_name(self, request):
+        return request.headers.get(get_tenant_header()) or None
+
+
+class SignedTokenTenantResolver(TenantResolver):
+    """
+    Takes the schema name from a token made by ``make_tenant_token()``, sent in
+    the ``TENANT_TOKEN_HEADER`` request header. Tokens are signed with
+    ``SECRET_KEY`` and expire after ``TENANT_TOKEN_MAX_AGE`` seconds.
+    """
+
+    def get_schema_name(self, request):
+        token = request.headers.get(get_tenant_token_header())
+        if not token:
+            return None
+        try:
+            claims = signing.loads(token, salt=TENANT_TOKEN_SALT, max_age=get_tenant_token_max_age())
+        except signing.BadSignature:
+            raise PermissionDenied('Invalid tenant token')
+        return claims['schema_name']
+
+
+def make_tenant_token(schema_name):
+    """
+    Returns a token identifying the tenant with `schema_name` to
+    ``SignedTokenTenantResolver``.
+    """
+    return signing.dumps({'schema_name': schema_name}, salt=TENANT_TOKEN_SALT)
+
+
+@lru_cache(maxsize=8)
+def _load_tenant_resolvers(paths):
+    return [import_string(path)() for path in paths]
+
+
+def get_tenant_resolvers():
+    return _load_tenant_resolvers(tuple(get_tenant_resolver_paths()))
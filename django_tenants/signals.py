@@ -1,6 +1,7 @@
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import Signal, receiver
-from django_tenants.utils import get_tenant_model, schema_exists
+from django_tenants.tenant_cache import evict_tenant, schema_cache_key
+from django_tenants.utils import get_tenant_model, get_tenant_domain_model, schema_exists
 
 post_schema_sync = Signal()
 post_schema_sync.__doc__ = """
@@ -50,3 +51,12 @@ def tenant_delete_callback(sender, instance, **kwargs):
 
     if instance.auto_drop_schema and schema_exists(instance.schema_name):
         instance._drop_schema(True)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def tenant_cache_callback(sender, instance, **kwargs):
+    if isinstance(instance, get_tenant_model()):
+        evict_tenant(instance.pk, key=schema_cache_key(instance.schema_name))
+    elif isinstance(instance, get_tenant_domain_model()):
+        evict_tenant(instance.tenant_id, key=instance.domain)
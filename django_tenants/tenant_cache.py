@@ -0,0 +1,495 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.db import connections, transaction
+
+from django_tenants.utils import (
+    get_public_schema_name,
+    get_tenant_database_alias,
+    get_tenant_domain_cache_size,
+    get_tenant_domain_cache_timeout,
+    get_tenant_domain_negative_cache_size,
+    get_tenant_domain_negative_cache_timeout,
+    get_tenant_domain_shared_cache_alias,
+    get_tenant_domain_shared_cache_timeout,
+    get_tenant_domain_model,
+    get_tenant_domain_preload,
+    get_tenant_domain_preload_interval,
+    get_tenant_model,
+    get_tenant_wildcard_domains,
+    schema_context,
+)
+
+WILDCARD_PREFIX = '*.'
+
+_NOT_LOADED = object()
+
+
+def schema_cache_key(schema_name):
+    """
+    Returns the key tenants looked up by schema name are cached under. It
+    contains a slash, which neither hostnames nor subfolders can, so it
+    never collides with theirs.
+    """
+    return 'schema/%s' % schema_name
+
+
+class ExpiringLRUCache:
+    """
+    A small, thread-safe LRU whose entries also expire ``timeout`` seconds
+    after they were stored. The least recently used entry is dropped once
+    ``max_size`` is reached.
+    """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TenantCache(ExpiringLRUCache):
+    """
+    Maps hostnames, and the keys from ``schema_cache_key()``, to tenant
+    instances.
+
+    Writes to the tenant and domain models evict the affected entries straight
+    away (see ``django_tenants.signals``), so the timeout only bounds how long
+    another process can keep serving a tenant that was changed elsewhere.
+    """
+
+    def get(self, key):
+        """
+        Returns a copy of the tenant cached for `key`, or None. A copy is handed
+        out so that the attributes the middleware sets on it (``domain_url``,
+        ``domain_subfolder``) never leak between requests.
+        """
+        tenant = self._get(key)
+        if tenant is None:
+            return None
+        return copy.copy(tenant)
+
+    def set(self, key, tenant):
+        self._set(key, copy.copy(tenant))
+
+    def evict_tenant(self, tenant_pk):
+        """
+        Drops every entry resolving to the tenant with primary key `tenant_pk`.
+        """
+        with self._lock:
+            for key in [key for key, (_, tenant) in self._entries.items() if tenant.pk == tenant_pk]:
+                del self._entries[key]
+
+
+class NegativeCache(ExpiringLRUCache):
+    """
+    Remembers hostnames that did not resolve to any tenant, so that requests
+    for unknown hosts do not reach the database on every retry.
+
+    With a shared cache, each entry holds the generation it was found missing
+    in (see ``SharedTenantCache``): a domain added by another worker bumps the
+    generation, which every worker's entries then no longer match.
+    """
+
+    def contains(self, key, generation=None):
+        """
+        Returns whether `key` is known not to resolve, as of `generation`.
+        """
+        entry = self._get(key)
+        return entry is not None and entry[0] == generation
+
+    def add(self, key, generation=None):
+        self._set(key, (generation,))
+
+
+class SharedTenantCache:
+    """
+    Second tier of the hostname -> tenant cache, kept in one of the project's
+    Django caches so that every worker shares it.
+
+    Keys carry a generation number, which is bumped whenever a tenant or a
+    domain changes. Bumping it orphans every entry at once, so no worker can
+    read a tenant that was cached before the change.
+    """
+    generation_key = 'django_tenants:domain:generation'
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, generation, key):
+        return 'django_tenants:domain:%s:%s' % (generation, key)
+
+    def get_generation(self):
+        generation = self.cache.get(self.generation_key)
+        if generation is None:
+            if self.cache.add(self.generation_key, 1, timeout=None):
+                return 1
+            generation = self.cache.get(self.generation_key)
+        return generation
+
+    def get(self, generation, key):
+        return self.cache.get(self._key(generation, key))
+
+    def set(self, generation, key, tenant):
+        """
+        Stores `tenant` under the `generation` that was current *before* it was
+        read from the database, so that a change committed in between leaves
+        the entry orphaned instead of serving stale data under the new number.
+        """
+        self.cache.set(self._key(generation, key), tenant, timeout=self.timeout)
+
+    def bump_generation(self):
+        # With the tenant aware KEY_FUNCTION the key depends on the current
+        # schema, while lookups always happen on the public schema.
+        public_schema_name = get_public_schema_name()
+        if connections[get_tenant_database_alias()].schema_name != public_schema_name:
+            with schema_context(public_schema_name):
+                self._incr_generation()
+        else:
+            self._incr_generation()
+
+    def _incr_generation(self):
+        try:
+            self.cache.incr(self.generation_key)
+        except ValueError:
+            self.cache.add(self.generation_key, 1, timeout=None)
+
+
+def wildcard_domains(hostname):
+    """
+    Returns the wildcard domains that would match `hostname`, most specific
+    first: ``a.b.example.com`` gives ``*.b.example.com``, ``*.example.com``
+    and ``*.com``.
+    """
+    labels = hostname.split('.')
+    return [WILDCARD_PREFIX + '.'.join(labels[i:]) for i in range(1, len(labels))]
+
+
+DOMAIN_VERSION_SEQUENCE = 'django_tenants_domain_version'
+
+
+def _domain_version_sequence(connection):
+    return '%s.%s' % (connection.ops.quote_name(get_public_schema_name()),
+                      connection.ops.quote_name(DOMAIN_VERSION_SEQUENCE))
+
+
+def get_domain_version():
+    """
+    Returns the number of tenant and domain changes recorded by
+    :func:`bump_domain_version`, or None if none ever was.
+    """
+    connection = connections[get_tenant_database_alias()]
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT last_value FROM pg_catalog.pg_sequences WHERE schemaname = %s AND sequencename = %s",
+                       [get_public_schema_name(), DOMAIN_VERSION_SEQUENCE])
+        row = cursor.fetchone()
+    return row[0] if row is not None else None
+
+
+def bump_domain_version():
+    """
+    Records in the database that a tenant or domain changed, so that the
+    domain snapshot of every worker reloads on its next check.
+    """
+    alias = get_tenant_database_alias()
+    connection = connections[alias]
+    sequence = _domain_version_sequence(connection)
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [sequence])
+        if cursor.fetchone()[0] is None:
+            cursor.execute("CREATE SEQUENCE IF NOT EXISTS %s" % sequence)
+        cursor.execute("SELECT nextval(%s)", [sequence])
+
+
+class DomainTrie:
+    """
+    Wildcard domains, stored as a trie of their labels in reverse order.
+
+    Finding the most specific wildcard for a hostname takes one dictionary
+    lookup per label, however many wildcard domains there are.
+    """
+    _value = object()
+
+    def __init__(self, domains=()):
+        self._root = {}
+        for domain, value in domains:
+            if domain.startswith(WILDCARD_PREFIX):
+                self.add(domain, value)
+
+    def add(self, domain, value):
+        node = self._root
+        for label in reversed(domain[len(WILDCARD_PREFIX):].split('.')):
+            node = node.setdefault(label, {})
+        node[self._value] = value
+
+    def match(self, hostname):
+        """
+        Returns the value of the longest wildcard domain matching `hostname`,
+        or None. A wildcard only matches subdomains, never the bare suffix.
+        """
+        node = self._root
+        value = None
+        for label in reversed(hostname.split('.')[1:]):
+            node = node.get(label)
+            if node is None:
+                break
+            value = node.get(self._value, value)
+        return value
+
+
+class DomainSnapshot:
+    """
+    Every domain -> tenant mapping, loaded in one go so that resolving a
+    tenant needs no database access at all.
+
+    At most every ``refresh_interval`` seconds one request checks a change
+    marker -- a version number bumped in the database whenever a tenant or
+    domain is saved or deleted -- and reloads the mapping if it moved. Each
+    tenant is held once, however many domains point at it.
+    """
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self._domains = {}
+        self._wildcards = DomainTrie()
+        self._tenants = {}
+        self._schema_names = {}
+        self._marker = _NOT_LOADED
+        self._next_refresh = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._domains)
+
+    def get(self, hostname, refresh=True):
+        """
+        Returns a copy of the tenant `hostname` belongs to, or None if the
+        snapshot doesn't know the hostname. Unless `refresh` is False, a due
+        refresh happens first.
+        """
+        if refresh and self.refresh_due():
+            self.refresh()
+        tenant_pk = self._domains.get(hostname)
+        if tenant_pk is None and get_tenant_wildcard_domains():
+            tenant_pk = self._wildcards.match(hostname)
+        if tenant_pk is None:
+            return None
+        tenant = self._tenants.get(tenant_pk)
+        if tenant is None:
+            return None
+        return copy.copy(tenant)
+
+    def get_by_schema_name(self, schema_name, refresh=True):
+        """
+        Returns a copy of the tenant with `schema_name`, or None if the
+        snapshot doesn't know it.
+        """
+        if refresh and self.refresh_due():
+            self.refresh()
+        tenant = self._tenants.get(self._schema_names.get(schema_name))
+        if tenant is None:
+            return None
+        return copy.copy(tenant)
+
+    def refresh_due(self):
+        """
+        Returns whether the change marker is due to be checked.
+        """
+        return time.monotonic() >= self._next_refresh
+
+    def invalidate(self):
+        """
+        Makes the next lookup check the change marker.
+        """
+        self._next_refresh = 0
+
+    def refresh(self):
+        # Only one thread refreshes; the others keep using the current mapping
+        # and fall back to the database for anything it doesn't have yet.
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            marker = get_domain_version()
+            if marker != self._marker:
+                self._load(marker)
+            self._next_refresh = time.monotonic() + self.refresh_interval
+        finally:
+            self._lock.release()
+
+    def _load(self, marker):
+        tenants = {tenant.pk: tenant for tenant in get_tenant_model().objects.iterator(chunk_size=2000)}
+        domains = dict(get_tenant_domain_model().objects.values_list('domain', 'tenant_id').iterator(chunk_size=2000))
+        self._tenants, self._domains, self._marker = tenants, domains, marker
+        self._schema_names = {tenant.schema_name: tenant.pk for tenant in tenants.values()}
+        self._wildcards = DomainTrie(domains.items())
+
+
+_domain_cache = None
+_negative_cache = None
+_shared_cache = None
+_domain_snapshot = None
+
+
+def get_domain_cache():
+    """
+    Returns the process wide hostname -> tenant cache, or None when
+    ``TENANT_DOMAIN_CACHE_SIZE`` is not set.
+    """
+    global _domain_cache
+
+    max_size = get_tenant_domain_cache_size()
+    if not max_size:
+        return None
+
+    timeout = get_tenant_domain_cache_timeout()
+    if _domain_cache is None or (_domain_cache.max_size, _domain_cache.timeout) != (max_size, timeout):
+        _domain_cache = TenantCache(max_size, timeout)
+    return _domain_cache
+
+
+def get_negative_cache():
+    """
+    Returns the process wide cache of unknown hostnames, or None when
+    ``TENANT_DOMAIN_NEGATIVE_CACHE_SIZE`` is not set.
+    """
+    global _negative_cache
+
+    max_size = get_tenant_domain_negative_cache_size()
+    if not max_size:
+        return None
+
+    timeout = get_tenant_domain_negative_cache_timeout()
+    if _negative_cache is None or (_negative_cache.max_size, _negative_cache.timeout) != (max_size, timeout):
+        _negative_cache = NegativeCache(max_size, timeout)
+    return _negative_cache
+
+
+def get_shared_cache():
+    """
+    Returns the cross-worker hostname -> tenant cache, or None when
+    ``TENANT_DOMAIN_SHARED_CACHE`` is not set.
+    """
+    global _shared_cache
+
+    alias = get_tenant_domain_shared_cache_alias()
+    if not alias:
+        return None
+
+    timeout = get_tenant_domain_shared_cache_timeout()
+    if _shared_cache is None or (_shared_cache.alias, _shared_cache.timeout) != (alias, timeout):
+        _shared_cache = SharedTenantCache(alias, timeout)
+    return _shared_cache
+
+
+def get_domain_snapshot():
+    """
+    Returns the process wide snapshot of all domains, or None when
+    ``TENANT_DOMAIN_PRELOAD`` is not set.
+    """
+    global _domain_snapshot
+
+    if not get_tenant_domain_preload():
+        return None
+
+    refresh_interval = get_tenant_domain_preload_interval()
+    if _domain_snapshot is None or _domain_snapshot.refresh_interval != refresh_interval:
+        _domain_snapshot = DomainSnapshot(refresh_interval)
+    return _domain_snapshot
+
+
+def get_cached_tenant_nowait(hostname=None, schema_name=None):
+    """
+    Returns the tenant for `hostname`, or the one with `schema_name`, if this
+    process already holds it, otherwise None. Neither the database nor the
+    shared cache is consulted, so this is safe to call from the event loop.
+    """
+    domain_snapshot = get_domain_snapshot()
+    if domain_snapshot is not None:
+        # Refreshing the snapshot queries the database: when it is due, leave
+        # the lookup to the caller's blocking path, which refreshes it first.
+        if domain_snapshot.refresh_due():
+            return None
+        if schema_name is not None:
+            tenant = domain_snapshot.get_by_schema_name(schema_name, refresh=False)
+        else:
+            tenant = domain_snapshot.get(hostname, refresh=False)
+        if tenant is not None:
+            return tenant
+
+    domain_cache = get_domain_cache()
+    if domain_cache is not None:
+        return domain_cache.get(schema_cache_key(schema_name) if schema_name is not None else hostname)
+    return None
+
+
+def evict_tenant(tenant_pk, key=None):
+    """
+    Forgets everything cached about the tenant with primary key `tenant_pk`,
+    and about the hostname or schema key `key` if given.
+    """
+    if key is not None and key.startswith(WILDCARD_PREFIX):
+        # A wildcard can change how any number of cached hostnames resolve.
+        if _domain_cache is not None:
+            _domain_cache.clear()
+        if _negative_cache is not None:
+            _negative_cache.clear()
+    else:
+        if _domain_cache is not None:
+            _domain_cache.evict_tenant(tenant_pk)
+            if key is not None:
+                _domain_cache.evict(key)
+        if _negative_cache is not None and key is not None:
+            _negative_cache.evict(key)
+
+    # The generation is bumped once the change is visible to other workers;
+    # bumping earlier would let them re-cache the old rows under the new one.
+    transaction.on_commit(_bump_generation, using=get_tenant_database_alias())
+
+
+def _bump_generation():
+    if get_tenant_domain_preload():
+        bump_domain_version()
+    if _domain_snapshot is not None:
+        _domain_snapshot.invalidate()
+
+    shared_cache = get_shared_cache()
+    if shared_cache is not None:
+        shared_cache.bump_generation()
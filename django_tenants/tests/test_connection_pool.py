@@ -0,0 +1,159 @@
+"""
+Tests for ``TenantConnectionPool``, used in place of Django's psycopg pool.
+
+A pooled connection keeps the search_path its last borrower left it on. The
+pool remembers it, so that a connection already on the current tenant's path
+is handed out without another ``SET search_path``.
+"""
+
+import threading
+from time import monotonic, sleep
+from unittest import skipUnless
+
+from django.db import connection
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+from dts_test_app.models import DummyModel
+
+from django_tenants.tests.testcases import BaseTestCase
+from django_tenants.utils import get_tenant_model, tenant_context
+
+try:
+    from psycopg_pool import PoolTimeout
+
+    HAS_PSYCOPG_POOL = is_psycopg3
+except ImportError:
+    HAS_PSYCOPG_POOL = False
+
+
+@skipUnless(HAS_PSYCOPG_POOL, 'psycopg_pool is not installed')
+class TenantConnectionPoolTest(BaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sync_shared()
+
+    def setUp(self):
+        super().setUp()
+
+        self.tenant1 = get_tenant_model()(schema_name='pool_tenant_1')
+        self.tenant1.save()
+        self.tenant2 = get_tenant_model()(schema_name='pool_tenant_2')
+        self.tenant2.save()
+        connection.set_schema_to_public()
+
+        connection.close()
+        self.options = connection.settings_dict['OPTIONS']
+        connection.settings_dict['OPTIONS'] = dict(self.options, pool={
+            'min_size': 0, 'max_size': 2, 'max_tenant_size': 1,
+        })
+
+    def tearDown(self):
+        connection.close()
+        connection.close_pool()
+        connection.settings_dict['OPTIONS'] = self.options
+
+        connection.set_schema_to_public()
+        self.tenant2.delete(force_drop=True)
+        self.tenant1.delete(force_drop=True)
+
+        super().tearDown()
+
+    def test_connection_on_the_tenant_path_is_reused(self):
+        with tenant_context(self.tenant1):
+            # SET + COUNT
+            with self.assertNumQueries(2):
+                self.assertEqual(0, DummyModel.objects.count())
+            connection.close()
+
+            # back on the same path: no SET
+            with self.assertNumQueries(1):
+                self.assertEqual(0, DummyModel.objects.count())
+            connection.close()
+
+        with tenant_context(self.tenant2):
+            # SET + COUNT
+            with self.assertNumQueries(2):
+                self.assertEqual(0, DummyModel.objects.count())
+            connection.close()
+
+    def test_rolled_back_path_is_forgotten(self):
+        with tenant_context(self.tenant1):
+            connection.set_autocommit(False)
+            self.assertEqual(0, DummyModel.objects.count())
+            # returned mid-transaction: the pool rolls the SET back
+            connection.close()
+
+            with self.assertNumQueries(2):
+                self.assertEqual(0, DummyModel.objects.count())
+            connection.close()
+
+    def test_connections_per_tenant_are_capped(self):
+        pool = connection.pool
+        with tenant_context(self.tenant1):
+            self.assertEqual(0, DummyModel.objects.count())
+
+            # the tenant already holds its single connection
+            pool.request(None, 'pool_tenant_1')
+            with self.assertRaises(PoolTimeout):
+                pool.getconn(timeout=0.1)
+
+            # other tenants are not held back by it
+            pool.request(None, 'pool_tenant_2')
+            conn = pool.getconn(timeout=1)
+            pool.putconn(conn)
+
+            connection.close()
+
+        pool.request(None, 'pool_tenant_1')
+        conn = pool.getconn(timeout=1)
+        pool.putconn(conn)
+
+    def test_released_slot_wakes_its_own_tenant(self):
+        pool = connection.pool
+        pool._acquire_tenant_slot('pool_tenant_1', monotonic() + 1, 1)
+        pool._acquire_tenant_slot('pool_tenant_2', monotonic() + 1, 1)
+
+        def wait_for_slot(tenant, timeout, errors):
+            try:
+                pool._acquire_tenant_slot(tenant, monotonic() + timeout, timeout)
+            except PoolTimeout as e:
+                errors.append(e)
+
+        # tenant2's waiter is the first in line, tenant1's the second
+        errors = []
+        waiters = [threading.Thread(target=wait_for_slot, args=('pool_tenant_2', 0.5, [])),
+                   threading.Thread(target=wait_for_slot, args=('pool_tenant_1', 5, errors))]
+        for i, waiter in enumerate(waiters, 1):
+            waiter.start()
+            while len(pool._tenant_condition._waiters) < i:
+                sleep(0.01)
+
+        pool._release_tenant_slot('pool_tenant_1')
+        waiters[1].join(1)
+        self.assertFalse(waiters[1].is_alive())
+        self.assertEqual([], errors)
+
+        waiters[0].join()
+        pool._release_tenant_slot('pool_tenant_1')
+        pool._release_tenant_slot('pool_tenant_2')
+
+    def test_db_settings_of_the_last_borrower_are_reset(self):
+        self.tenant1.get_db_settings = lambda: {'work_mem': '5MB'}
+
+        def current_work_mem():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid(), current_setting('work_mem')")
+                return cursor.fetchone()
+
+        with tenant_context(self.tenant1):
+            pid, work_mem = current_work_mem()
+            self.assertEqual('5MB', work_mem)
+            connection.close()
+
+        with tenant_context(self.tenant2):
+            # the same connection, without tenant1's settings
+            reused_pid, work_mem = current_work_mem()
+            self.assertEqual(pid, reused_pid)
+            self.assertNotEqual('5MB', work_mem)
+            connection.close()
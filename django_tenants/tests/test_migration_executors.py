@@ -1,20 +1,46 @@
-"""Unit tests for the migration executors, focused on SubprocessExecutor.
+"""Unit tests for the migration executors, focused on SubprocessExecutor and
+ThreadedExecutor.
 
 These tests mock ``subprocess.run`` at the system boundary so no real
 ``migrate_schemas`` child processes are spawned. They assert on how the
 executor selects parallelism, builds the child argv, and propagates failures.
 """
 
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
 from unittest import mock
 
+import django.db.migrations.executor
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.management.commands import migrate
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
 from django.test import SimpleTestCase, override_settings
 
 from django_tenants.management.commands.migrate_schemas import MigrateSchemasCommand
 from django_tenants.migration_executors import get_executor
+from django_tenants.migration_executors.loader import (
+    CachedMigrateCommand,
+    CachedMigrationLoader,
+    get_cached_migrate_command_class,
+)
 from django_tenants.migration_executors.subproc import SubprocessExecutor
+from django_tenants.migration_executors.threaded import ThreadedExecutor, ThreadLineBufferedStream
+from django_tenants.migration_executors.unapplied import get_schemas_with_unapplied_migrations
+from django_tenants.signals import schema_pre_migration
+from django_tenants.tests.test_tenants import catch_signal
+from django_tenants.tests.testcases import BaseTestCase
+from django_tenants.utils import get_tenant_model
 
 
 SUBPROC = "django_tenants.migration_executors.subproc"
+THREADED = "django_tenants.migration_executors.threaded"
 
 
 def _contains_subsequence(seq, sub):
@@ -234,3 +260,273 @@ class SubprocessExecutorMultiTypeTests(SimpleTestCase):
         executor = make_executor()
         with self.assertRaises(NotImplementedError):
             executor.run_multi_type_migrations(tenants=[("schema", "type1")])
+
+
+def make_threaded_executor(args=(), **options):
+    options.setdefault("verbosity", 1)
+    return ThreadedExecutor(list(args), options)
+
+
+class ThreadedExecutorTests(SimpleTestCase):
+    def test_get_executor_resolves_threaded(self):
+        self.assertIs(get_executor("threaded"), ThreadedExecutor)
+
+    def test_max_parallel(self):
+        self.assertEqual(make_threaded_executor(parallel=3)._max_parallel(), 3)
+        with override_settings(TENANT_THREADED_PARALLEL=2):
+            self.assertEqual(make_threaded_executor()._max_parallel(), 2)
+        self.assertEqual(make_threaded_executor()._max_parallel(), 4)
+        self.assertEqual(make_threaded_executor(parallel=0)._max_parallel(), 1)
+
+    def test_tenants_are_migrated_in_threads(self):
+        executor = make_threaded_executor(parallel=2)
+        public = executor.PUBLIC_SCHEMA_NAME
+        calls = []
+
+        def fake_run_migrations(args, options, codename, schema_name, **kwargs):
+            calls.append((schema_name, threading.current_thread() is threading.main_thread(),
+                          django.db.migrations.executor.MigrationLoader))
+
+        with mock.patch(f"{THREADED}.run_migrations", side_effect=fake_run_migrations), \
+                mock.patch(f"{THREADED}.connections"):
+            executor.run_migrations(tenants=[public, "tenant_a", "tenant_b"])
+
+        # Django's own modules are left alone while the threads run.
+        self.assertEqual([(public, True, MigrationLoader), ("tenant_a", False, MigrationLoader),
+                          ("tenant_b", False, MigrationLoader)], sorted(calls))
+
+    def test_multi_type_tenants_keep_their_type(self):
+        executor = make_threaded_executor()
+
+        with mock.patch(f"{THREADED}.run_migrations") as run_migrations, mock.patch(f"{THREADED}.connections"):
+            executor.run_multi_type_migrations(tenants=[("tenant_a", "type1")])
+
+        run_migrations.assert_called_once_with(executor.args, executor.options, "threaded", "tenant_a",
+                                               tenant_type="type1", allow_atomic=False, idx=0, count=1)
+
+    def test_failure_cancels_pending_and_propagates(self):
+        executor = make_threaded_executor(parallel=2)
+        tenants = ["fail", "slow1", "slow2", "slow3", "slow4", "slow5"]
+        started = []
+
+        def fake_run_migrations(args, options, codename, schema_name, **kwargs):
+            started.append(schema_name)
+            if schema_name == "fail":
+                raise SystemExit(1)
+            time.sleep(0.3)
+
+        with mock.patch(f"{THREADED}.run_migrations", side_effect=fake_run_migrations), \
+                mock.patch(f"{THREADED}.connections"):
+            with self.assertRaises(SystemExit):
+                executor.run_migrations(tenants=tenants)
+
+        self.assertIn("fail", started)
+        self.assertLess(len(started), len(tenants))
+
+    def test_lines_of_threads_do_not_run_into_each_other(self):
+        out = io.StringIO()
+        stream = ThreadLineBufferedStream(out)
+        other_thread_wrote = threading.Event()
+
+        def other_thread():
+            stream.write("[b] Applying...")
+            stream.flush()
+            stream.write(" OK\n")
+            other_thread_wrote.set()
+
+        stream.write("[a] Applying...")
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        other_thread_wrote.wait()
+        stream.write(" OK\n[a] Unapplying...")
+        thread.join()
+        self.assertEqual("[b] Applying... OK\n[a] Applying... OK\n", out.getvalue())
+
+        stream.flush_thread()
+
+        self.assertEqual("[b] Applying... OK\n[a] Applying... OK\n[a] Unapplying...", out.getvalue())
+
+
+class ThreadedExecutorMigrationTests(BaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sync_shared()
+
+    def setUp(self):
+        super().setUp()
+        self.tenants = []
+        for schema_name in ("threaded_1", "threaded_2", "threaded_3"):
+            tenant = get_tenant_model()(schema_name=schema_name)
+            tenant.save()
+            connection.set_schema_to_public()
+            self.tenants.append(tenant)
+
+    def tearDown(self):
+        connection.set_schema_to_public()
+        for tenant in reversed(self.tenants):
+            tenant.delete(force_drop=True)
+        super().tearDown()
+
+    def test_tenants_are_migrated(self):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            call_command("migrate_schemas", "dts_test_app", "zero", tenant=True, executor="threaded",
+                         interactive=False, verbosity=1)
+        for tenant in self.tenants:
+            self.assertNotIn("dts_test_app_dummymodel", self.get_tables_list_in_schema(tenant.schema_name))
+
+        with contextlib.redirect_stdout(stdout):
+            call_command("migrate_schemas", tenant=True, executor="threaded", interactive=False, verbosity=1)
+        for tenant in self.tenants:
+            self.assertIn("dts_test_app_dummymodel", self.get_tables_list_in_schema(tenant.schema_name))
+
+        # three tenants at once, and each line in one piece
+        applying = [line for line in stdout.getvalue().splitlines() if "Applying dts_test_app.0001_initial" in line]
+        self.assertEqual(["  Applying dts_test_app.0001_initial... OK"] * 3, applying)
+
+
+class UnappliedMigrationsScanTests(BaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sync_shared()
+
+    def setUp(self):
+        super().setUp()
+        self.tenants = []
+        for schema_name in ("scan_1", "scan_2", "scan_3"):
+            tenant = get_tenant_model()(schema_name=schema_name)
+            tenant.save()
+            connection.set_schema_to_public()
+            self.tenants.append(tenant)
+        call_command("migrate_schemas", "dts_test_app", "zero", schema_name="scan_2", interactive=False,
+                     verbosity=0)
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE SCHEMA scan_bare")
+
+    def tearDown(self):
+        connection.set_schema_to_public()
+        with connection.cursor() as cursor:
+            cursor.execute("DROP SCHEMA scan_bare")
+        for tenant in reversed(self.tenants):
+            tenant.delete(force_drop=True)
+        super().tearDown()
+
+    def test_schemas_with_unapplied_migrations(self):
+        schema_names = ["scan_1", "scan_2", "scan_3", "scan_bare"]
+        with self.assertNumQueries(2):
+            self.assertEqual({"scan_2", "scan_bare"},
+                             get_schemas_with_unapplied_migrations(schema_names, "default"))
+        self.assertEqual({"scan_bare"}, get_schemas_with_unapplied_migrations(schema_names, "default",
+                                                                              app_label="customers"))
+        self.assertIsNone(get_schemas_with_unapplied_migrations(schema_names, "default", app_label="nope"))
+
+    def test_only_tenants_with_unapplied_migrations_are_migrated(self):
+        with catch_signal(schema_pre_migration) as handler:
+            call_command("migrate_schemas", tenant=True, skip_up_to_date=True, executor="standard",
+                         interactive=False, verbosity=0)
+        handler.assert_called_once_with(schema_name="scan_2", sender=mock.ANY, signal=schema_pre_migration)
+        self.assertIn("dts_test_app_dummymodel", self.get_tables_list_in_schema("scan_2"))
+
+        with catch_signal(schema_pre_migration) as handler:
+            call_command("migrate_schemas", tenant=True, skip_up_to_date=True, executor="standard",
+                         interactive=False, verbosity=0)
+        handler.assert_not_called()
+
+    def test_check_only_visits_tenants_with_unapplied_migrations(self):
+        # The multiprocessing executor's pool does not survive a worker's sys.exit().
+        with catch_signal(schema_pre_migration) as handler:
+            with self.assertRaises(SystemExit):
+                call_command("migrate_schemas", tenant=True, check_unapplied=True, executor="standard",
+                             interactive=False, verbosity=0)
+        handler.assert_called_once_with(schema_name="scan_2", sender=mock.ANY, signal=schema_pre_migration)
+
+        call_command("migrate_schemas", schema_name="scan_2", interactive=False, verbosity=0)
+        with catch_signal(schema_pre_migration) as handler:
+            call_command("migrate_schemas", tenant=True, check_unapplied=True, executor="standard",
+                         interactive=False, verbosity=0)
+        handler.assert_not_called()
+
+
+class CachedMigrationsTests(BaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sync_shared()
+
+    def setUp(self):
+        super().setUp()
+        self.tenants = []
+        for schema_name in ("cached_1", "cached_2", "cached_3"):
+            tenant = get_tenant_model()(schema_name=schema_name)
+            tenant.save()
+            connection.set_schema_to_public()
+            self.tenants.append(tenant)
+        CachedMigrationLoader.cache.clear()
+
+    def tearDown(self):
+        connection.set_schema_to_public()
+        for tenant in reversed(self.tenants):
+            tenant.delete(force_drop=True)
+        super().tearDown()
+
+    def test_graph_and_state_are_built_once_for_all_tenants(self):
+        load_disk = mock.patch.object(MigrationLoader, "load_disk", autospec=True,
+                                      side_effect=MigrationLoader.load_disk)
+        build_graph = mock.patch.object(MigrationLoader, "build_graph", autospec=True,
+                                        side_effect=MigrationLoader.build_graph)
+        create_project_state = mock.patch.object(MigrationExecutor, "_create_project_state", autospec=True,
+                                                 side_effect=MigrationExecutor._create_project_state)
+        # Counted in this process: not in the multiprocessing executor's workers.
+        with load_disk as load_disk, build_graph as build_graph, create_project_state as create_project_state:
+            call_command("migrate_schemas", tenant=True, executor="standard", interactive=False, verbosity=0)
+
+        self.assertEqual(1, load_disk.call_count)
+        self.assertEqual(1, build_graph.call_count)
+        self.assertEqual(1, len([call for call in create_project_state.call_args_list
+                                 if call.kwargs.get("with_applied_migrations")]))
+
+    def test_cache_is_kept_until_the_migrations_change(self):
+        call_command("migrate_schemas", tenant=True, interactive=False, verbosity=0)
+
+        cache = CachedMigrationLoader.cache
+        self.assertTrue(cache.graphs)
+        self.assertIs(django.db.migrations.executor.MigrationLoader, MigrationLoader)
+
+        # Creating a tenant migrates its schema from what is cached.
+        load_disk = mock.patch.object(MigrationLoader, "load_disk", autospec=True,
+                                      side_effect=MigrationLoader.load_disk)
+        with load_disk as load_disk:
+            tenant = get_tenant_model()(schema_name="cached_4")
+            tenant.save()
+            connection.set_schema_to_public()
+            self.tenants.append(tenant)
+        load_disk.assert_not_called()
+
+        migration_file = sys.modules["dts_test_app.migrations.0001_initial"].__file__
+        stat = os.stat(migration_file)
+        try:
+            os.utime(migration_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+            cache.check_sources()
+            self.assertEqual(({}, {}, {}), (cache.disk, cache.graphs, cache.project_states))
+        finally:
+            os.utime(migration_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    def test_migrate_command_subclasses_run_cached(self):
+        class Command(migrate.Command):
+            pass
+
+        self.assertIs(CachedMigrateCommand, get_cached_migrate_command_class(migrate.Command))
+        self.assertEqual((Command, CachedMigrateCommand), get_cached_migrate_command_class(Command).__bases__)
+        self.assertIs(BaseCommand, get_cached_migrate_command_class(BaseCommand))
+
+    def test_tenants_are_migrated_from_the_cached_state(self):
+        for _ in range(2):
+            call_command("migrate_schemas", "dts_test_app", "zero", tenant=True, interactive=False, verbosity=0)
+            for tenant in self.tenants:
+                self.assertNotIn("dts_test_app_dummymodel", self.get_tables_list_in_schema(tenant.schema_name))
+
+            call_command("migrate_schemas", tenant=True, interactive=False, verbosity=0)
+            for tenant in self.tenants:
+                self.assertIn("dts_test_app_dummymodel", self.get_tables_list_in_schema(tenant.schema_name))
@@ -0,0 +1,71 @@
+"""
+Tests for prepared statements under tenancy.
+
+With ``server_side_binding`` and a ``prepare_threshold``, psycopg prepares the
+statements it runs repeatedly. Each search_path gets statements of its own, so
+that tenants taking turns on a connection don't keep PostgreSQL re-planning
+them.
+"""
+
+from unittest import skipUnless
+
+from django.db import connection
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+from dts_test_app.models import DummyModel
+
+from django_tenants.tests.testcases import BaseTestCase
+from django_tenants.utils import get_tenant_model, tenant_context
+
+
+@skipUnless(is_psycopg3, 'psycopg2 does not prepare statements')
+class PreparedStatementTenantTest(BaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sync_shared()
+
+    def setUp(self):
+        super().setUp()
+
+        self.tenant1 = get_tenant_model()(schema_name='prepared_tenant_1')
+        self.tenant1.save()
+        self.tenant2 = get_tenant_model()(schema_name='prepared_tenant_2')
+        self.tenant2.save()
+        connection.set_schema_to_public()
+
+        with tenant_context(self.tenant1):
+            DummyModel(name='t1').save()
+
+        connection.close()
+        self.options = connection.settings_dict['OPTIONS']
+        connection.settings_dict['OPTIONS'] = dict(self.options, server_side_binding=True,
+                                                   prepare_threshold=0, prepared_max=10)
+
+    def tearDown(self):
+        connection.close()
+        connection.settings_dict['OPTIONS'] = self.options
+
+        connection.set_schema_to_public()
+        self.tenant2.delete(force_drop=True)
+        self.tenant1.delete(force_drop=True)
+
+        super().tearDown()
+
+    def prepared_statements(self):
+        with connection.cursor() as cursor:
+            cursor.cursor.execute('SELECT statement FROM pg_prepared_statements')
+            return [statement for statement, in cursor.cursor.fetchall()]
+
+    def test_statements_are_prepared_per_search_path(self):
+        for _ in range(2):
+            with tenant_context(self.tenant1):
+                self.assertEqual(['t1'], list(DummyModel.objects.values_list('name', flat=True)))
+            with tenant_context(self.tenant2):
+                self.assertEqual([], list(DummyModel.objects.values_list('name', flat=True)))
+
+        statements = [statement for statement in self.prepared_statements() if 'dts_test_app_dummymodel' in statement]
+        self.assertEqual(2, len(statements))
+        self.assertEqual(['/* prepared_tenant_1,public */', '/* prepared_tenant_2,public */'],
+                         sorted(statement.split(' SELECT')[0] for statement in statements))
+        self.assertEqual(10, connection.connection.prepared_max)
@@ -1,8 +1,14 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
-from django.test.client import RequestFactory
+from django.db import connection
+from django.test.client import AsyncRequestFactory, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
 
 from django_tenants.middleware import TenantMainMiddleware, TenantSubfolderMiddleware
+from django_tenants.tenant_cache import get_domain_cache, get_negative_cache
 from django_tenants.tests.testcases import BaseTestCase
 from django_tenants.utils import get_tenant_model, get_tenant_domain_model, get_public_schema_name
 
@@ -85,6 +91,406 @@ class RoutesTestCase(BaseTestCase):
         self.assertEqual(request.tenant, self.public_tenant)
 
 
+class CachedRoutesTestCase(BaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        settings.SHARED_APPS = ('django_tenants',
+                                'customers')
+        settings.TENANT_APPS = ('dts_test_app',
+                                'django.contrib.contenttypes',
+                                'django.contrib.auth', )
+        settings.INSTALLED_APPS = settings.SHARED_APPS + settings.TENANT_APPS
+        cls.available_apps = settings.INSTALLED_APPS
+        cls.sync_shared()
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        self.tm = TenantMainMiddleware(lambda r: r)
+
+        self.tenant_domain = 'tenant.test.com'
+        self.tenant = get_tenant_model()(schema_name='test')
+        self.tenant.save()
+        self.domain = get_tenant_domain_model()(tenant=self.tenant, domain=self.tenant_domain)
+        self.domain.save()
+
+    def tearDown(self):
+        from django.db import connection
+
+        connection.set_schema_to_public()
+
+        self.domain.delete()
+        self.tenant.delete(force_drop=True)
+
+        super().tearDown()
+
+    @override_settings(TENANT_DOMAIN_CACHE_SIZE=10)
+    def test_cached_tenant_routing(self):
+        """
+        Once a hostname has been resolved, later requests for it are served
+        from the domain cache without querying the database.
+        """
+        get_domain_cache().clear()
+
+        request = self.factory.get('/any/request/', HTTP_HOST=self.tenant_domain)
+        self.tm.process_request(request)
+        self.assertEqual(request.tenant, self.tenant)
+
+        request = self.factory.get('/any/request/', HTTP_HOST=self.tenant_domain)
+        with self.assertNumQueries(0), \
+                mock.patch.object(connection, 'set_schema_to_public') as set_schema_to_public:
+            self.tm.process_request(request)
+        self.assertFalse(set_schema_to_public.called)
+        self.assertEqual(request.tenant, self.tenant)
+        self.assertEqual(request.tenant.domain_url, self.tenant_domain)
+        self.assertEqual(connection.tenant, self.tenant)
+
+    @override_settings(TENANT_DOMAIN_CACHE_SIZE=10)
+    def test_cached_tenant_is_evicted_on_domain_change(self):
+        """
+        Saving or deleting a domain drops the cached hostname.
+        """
+        get_domain_cache().clear()
+
+        request = self.factory.get('/any/request/', HTTP_HOST=self.tenant_domain)
+        self.tm.process_request(request)
+        self.assertEqual(len(get_domain_cache()), 1)
+
+        from django.db import connection
+        connection.set_schema_to_public()
+        self.domain.save()
+        self.assertEqual(len(get_domain_cache()), 0)
+
+        self.tm.process_request(request)
+        self.assertEqual(len(get_domain_cache()), 1)
+
+        connection.set_schema_to_public()
+        self.tenant.save()
+        self.assertEqual(len(get_domain_cache()), 0)
+
+    @override_settings(TENANT_DOMAIN_NEGATIVE_CACHE_SIZE=10, ALLOWED_HOSTS=['.test.com'])
+    def test_unknown_hostname_is_negatively_cached(self):
+        """
+        A hostname that failed to resolve is refused without another query,
+        until a domain with that hostname is created.
+        """
+        get_negative_cache().clear()
+
+        request = self.factory.get('/any/request/', HTTP_HOST='unknown.test.com')
+        with self.assertRaises(self.tm.TENANT_NOT_FOUND_EXCEPTION):
+            self.tm.process_request(request)
+
+        with self.assertNumQueries(0):
+            with self.assertRaises(self.tm.TENANT_NOT_FOUND_EXCEPTION):
+                self.tm.process_request(request)
+
+        from django.db import connection
+        connection.set_schema_to_public()
+        domain = get_tenant_domain_model()(tenant=self.tenant, domain='unknown.test.com', is_primary=False)
+        domain.save()
+
+        self.tm.process_request(request)
+        self.assertEqual(request.tenant, self.tenant)
+
+        connection.set_schema_to_public()
+        domain.delete()
+
+    @override_settings(TENANT_DOMAIN_NEGATIVE_CACHE_SIZE=10, TENANT_DOMAIN_SHARED_CACHE='default',
+                       ALLOWED_HOSTS=['.test.com'])
+    def test_negative_cache_follows_other_workers(self):
+        """
+        With a shared cache, a hostname negatively cached here resolves once
+        another worker adds its domain.
+        """
+        from django.core.cache import cache
+        from django.db import connection
+        from django_tenants.tenant_cache import get_shared_cache
+
+        cache.clear()
+        get_negative_cache().clear()
+
+        request = self.factory.get('/any/request/', HTTP_HOST='unknown.test.com')
+        with self.assertRaises(self.tm.TENANT_NOT_FOUND_EXCEPTION):
+            self.tm.process_request(request)
+        with self.assertNumQueries(0):
+            with self.assertRaises(self.tm.TENANT_NOT_FOUND_EXCEPTION):
+                self.tm.process_request(request)
+
+        # What another worker saving the domain does: no signal reaches this one.
+        connection.set_schema_to_public()
+        domain, = get_tenant_domain_model().objects.bulk_create([
+            get_tenant_domain_model()(tenant=self.tenant, domain='unknown.test.com', is_primary=False)])
+        get_shared_cache().bump_generation()
+
+        self.tm.process_request(request)
+        self.assertEqual(request.tenant, self.tenant)
+
+        connection.set_schema_to_public()
+        domain.delete()
+
+    @override_settings(TENANT_DOMAIN_SHARED_CACHE='default')
+    def test_shared_cache_tenant_routing(self):
+        """
+        Tenants are shared between workers through the Django cache, and a
+        change to a domain orphans the shared entries.
+        """
+        from django.core.cache import cache
+        cache.clear()
+
+        request = self.factory.get('/any/request/', HTTP_HOST=self.tenant_domain)
+        self.tm.process_request(request)
+
+        with self.assertNumQueries(0):
+            self.tm.process_request(request)
+        self.assertEqual(request.tenant, self.tenant)
+
+        from django.db import connection
+        connection.set_schema_to_public()
+        self.domain.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.tm.process_request(request)
+        self.assertEqual(request.tenant, self.tenant)
+        self.assertTrue(any('"customers_domain"' in query['sql'] for query in queries.captured_queries))
+
+    @override_settings(TENANT_DOMAIN_PRELOAD=True)
+    def test_preloaded_tenant_routing(self):
+        """
+        With the domain snapshot loaded, requests resolve without queries, and
+        domains added later are picked up at the next refresh.
+        """
+        from django.db import connection
+        from django_tenants.tenant_cache import get_domain_snapshot
+
+        snapshot = get_domain_snapshot()
+        snapshot.invalidate()
+
+        request = self.factory.get('/any/request/', HTTP_HOST=self.tenant_domain)
+        self.tm.process_request(request)
+        self.assertEqual(request.tenant, self.tenant)
+
+        with self.assertNumQueries(0):
+            self.tm.process_request(request)
+        self.assertEqual(request.tenant, self.tenant)
+
+        connection.set_schema_to_public()
+        domain = get_tenant_domain_model()(tenant=self.tenant, domain='other.test.com', is_primary=False)
+        domain.save()
+
+        self.assertEqual(snapshot.get('other.test.com'), self.tenant)
+        self.assertEqual(len(snapshot), 2)
+
+        connection.set_schema_to_public()
+        domain.delete()
+        self.assertIsNone(snapshot.get('other.test.com'))
+
+    @override_settings(TENANT_DOMAIN_PRELOAD=True)
+    def test_preloaded_snapshot_sees_changes_made_elsewhere(self):
+        """
+        Rows changed by another worker, which bumps the domain version when it
+        commits, are picked up at the next refresh; checking the version is a
+        single query.
+        """
+        from django.db import connection
+        from django_tenants.tenant_cache import bump_domain_version, get_domain_snapshot
+
+        other_tenant = get_tenant_model()(schema_name='other')
+        other_tenant.save()
+        snapshot = get_domain_snapshot()
+        snapshot.invalidate()
+        self.assertEqual(snapshot.get(self.tenant_domain), self.tenant)
+
+        # QuerySet.update() sends no signals, so the change goes unnoticed
+        # until the version moves.
+        get_tenant_domain_model().objects.filter(pk=self.domain.pk).update(tenant=other_tenant)
+        snapshot.invalidate()
+        with self.assertNumQueries(1):
+            self.assertEqual(snapshot.get(self.tenant_domain), self.tenant)
+
+        bump_domain_version()
+        snapshot.invalidate()
+        self.assertEqual(snapshot.get(self.tenant_domain), other_tenant)
+
+        get_tenant_model().objects.filter(pk=other_tenant.pk).update(schema_name='other2')
+        bump_domain_version()
+        snapshot.invalidate()
+        self.assertEqual(snapshot.get(self.tenant_domain).schema_name, 'other2')
+        self.assertIsNone(snapshot.get_by_schema_name('other'))
+
+        get_tenant_model().objects.filter(pk=other_tenant.pk).update(schema_name='other')
+        get_tenant_domain_model().objects.filter(pk=self.domain.pk).update(tenant=self.tenant)
+        connection.set_schema_to_public()
+        other_tenant.delete(force_drop=True)
+
+    @override_settings(TENANT_DOMAIN_PRELOAD=True)
+    def test_preloaded_domain_changes_reach_the_middleware(self):
+        """
+        A domain moved to another tenant, then deleted, stops resolving to its
+        old tenant on the next request, synchronous or not.
+        """
+        from django.db import connection
+        from django_tenants.tenant_cache import get_domain_snapshot
+
+        async def get_response(request):
+            return request
+
+        def asgi_request(hostname):
+            request = AsyncRequestFactory().get('/any/request/')
+            request.META['HTTP_HOST'] = hostname
+            return request
+
+        get_domain_snapshot().invalidate()
+        atm = TenantMainMiddleware(get_response)
+        request = self.factory.get('/any/request/', HTTP_HOST='other.test.com')
+
+        other_tenant = get_tenant_model()(schema_name='other')
+        other_tenant.save()
+        domain = get_tenant_domain_model()(tenant=self.tenant, domain='other.test.com', is_primary=False)
+        domain.save()
+        self.tm.process_request(request)
+        self.assertEqual(request.tenant, self.tenant)
+
+        connection.set_schema_to_public()
+        domain.tenant = other_tenant
+        domain.save()
+        self.tm.process_request(request)
+        self.assertEqual(request.tenant, other_tenant)
+        self.assertEqual(async_to_sync(atm)(asgi_request('other.test.com')).tenant, other_tenant)
+
+        connection.set_schema_to_public()
+        domain.delete()
+        with self.assertRaises(self.tm.TENANT_NOT_FOUND_EXCEPTION):
+            self.tm.process_request(request)
+        with self.assertRaises(atm.TENANT_NOT_FOUND_EXCEPTION):
+            async_to_sync(atm)(asgi_request('other.test.com'))
+
+        connection.set_schema_to_public()
+        other_tenant.delete(force_drop=True)
+
+    @override_settings(TENANT_DOMAIN_CACHE_SIZE=10)
+    def test_async_tenant_routing(self):
+        """
+        Under ASGI the tenant is looked up on a miss, and served from the
+        domain cache without queries afterwards.
+        """
+        from django.db import connection
+
+        async def get_response(request):
+            return request
+
+        def asgi_request(hostname):
+            request = AsyncRequestFactory().get('/any/request/')
+            request.META['HTTP_HOST'] = hostname
+            return request
+
+        get_domain_cache().clear()
+        tm = TenantMainMiddleware(get_response)
+
+        request = async_to_sync(tm)(asgi_request(self.tenant_domain))
+        self.assertEqual(request.tenant, self.tenant)
+
+        connection.set_schema_to_public()
+        with self.assertNumQueries(0):
+            request = async_to_sync(tm)(asgi_request(self.tenant_domain))
+        self.assertEqual(request.tenant, self.tenant)
+        self.assertEqual(request.tenant.domain_url, self.tenant_domain)
+        self.assertEqual(connection.schema_name, self.tenant.schema_name)
+
+        connection.set_schema_to_public()
+        with self.assertRaises(tm.TENANT_NOT_FOUND_EXCEPTION):
+            async_to_sync(tm)(asgi_request('unknown.test.com'))
+
+    @override_settings(TENANT_RESOLVERS=['django_tenants.resolvers.HeaderTenantResolver',
+                                         'django_tenants.resolvers.SignedTokenTenantResolver'])
+    def test_resolver_chain_routing(self):
+        """
+        Resolvers pick the tenant by schema name before the hostname is looked
+        at; requests they don't identify are resolved by hostname.
+        """
+        from django.core.exceptions import PermissionDenied
+        from django.db import connection
+        from django_tenants.resolvers import make_tenant_token
+
+        public_host = 'unknown.test.com'
+        for headers in ({'HTTP_X_TENANT': self.tenant.schema_name},
+                        {'HTTP_X_TENANT_TOKEN': make_tenant_token(self.tenant.schema_name)}):
+            connection.set_schema_to_public()
+            request = self.factory.get('/any/request/', HTTP_HOST=public_host, **headers)
+            self.tm.process_request(request)
+            self.assertEqual(request.tenant, self.tenant)
+
+        connection.set_schema_to_public()
+        request = self.factory.get('/any/request/', HTTP_HOST=self.tenant_domain)
+        self.tm.process_request(request)
+        self.assertEqual(request.tenant, self.tenant)
+
+        connection.set_schema_to_public()
+        with self.assertRaises(self.tm.TENANT_NOT_FOUND_EXCEPTION):
+            self.tm.process_request(self.factory.get('/any/request/', HTTP_HOST=self.tenant_domain,
+                                                     HTTP_X_TENANT='missing'))
+
+        connection.set_schema_to_public()
+        with self.assertRaises(PermissionDenied):
+            self.tm.process_request(self.factory.get('/any/request/', HTTP_HOST=self.tenant_domain,
+                                                     HTTP_X_TENANT_TOKEN='forged'))
+
+    @override_settings(TENANT_WILDCARD_DOMAINS=True)
+    def test_wildcard_tenant_routing(self):
+        """
+        Subdomains resolve to the most specific wildcard domain, while exact
+        domains still take precedence.
+        """
+        from django.db import connection
+
+        other_tenant = get_tenant_model()(schema_name='other')
+        other_tenant.save()
+        wildcard = get_tenant_domain_model()(tenant=self.tenant, domain='*.test.com', is_primary=False)
+        wildcard.save()
+        other_wildcard = get_tenant_domain_model()(tenant=other_tenant, domain='*.other.test.com')
+        other_wildcard.save()
+        self.assertTrue(wildcard.is_wildcard)
+
+        for hostname, tenant in (('foo.test.com', self.tenant),
+                                 ('foo.bar.test.com', self.tenant),
+                                 ('foo.other.test.com', other_tenant),
+                                 ('tenant.test.com', self.tenant)):
+            connection.set_schema_to_public()
+            request = self.factory.get('/any/request/', HTTP_HOST=hostname)
+            self.tm.process_request(request)
+            self.assertEqual(request.tenant, tenant)
+
+        connection.set_schema_to_public()
+        with self.assertRaises(self.tm.TENANT_NOT_FOUND_EXCEPTION):
+            self.tm.process_request(self.factory.get('/any/request/', HTTP_HOST='test.com'))
+
+        connection.set_schema_to_public()
+        other_wildcard.delete()
+        wildcard.delete()
+        other_tenant.delete(force_drop=True)
+
+    @override_settings(TENANT_WILDCARD_DOMAINS=True, TENANT_DOMAIN_PRELOAD=True)
+    def test_preloaded_wildcard_tenant_routing(self):
+        """
+        The domain snapshot resolves wildcard domains without queries.
+        """
+        from django.db import connection
+        from django_tenants.tenant_cache import get_domain_snapshot
+
+        wildcard = get_tenant_domain_model()(tenant=self.tenant, domain='*.test.com', is_primary=False)
+        wildcard.save()
+        get_domain_snapshot().refresh()
+
+        connection.set_schema_to_public()
+        request = self.factory.get('/any/request/', HTTP_HOST='foo.bar.test.com')
+        with self.assertNumQueries(0):
+            self.tm.process_request(request)
+        self.assertEqual(request.tenant, self.tenant)
+
+        connection.set_schema_to_public()
+        wildcard.delete()
+
+
 class SubfolderRoutesTestCase(BaseTestCase):
     @classmethod
     def setUpClass(cls):
@@ -156,6 +562,53 @@ class SubfolderRoutesTestCase(BaseTestCase):
         # request.tenant should also have been set
         self.assertEqual(request.tenant, self.public_tenant)
 
+    @override_settings(TENANT_DOMAIN_CACHE_SIZE=10)
+    def test_cached_public_schema_routing(self):
+        """
+        The public tenant is served from the domain cache, and fetched again
+        once it has been saved.
+        """
+        from django.db import connection
+
+        get_domain_cache().clear()
+        request = self.factory.get('/any/request/', HTTP_HOST=self.public_domain.domain)
+        self.tsf.process_request(request)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.tsf.process_request(self.factory.get('/any/request/', HTTP_HOST=self.public_domain.domain))
+        self.assertFalse(any('"customers_client"' in query['sql'] for query in queries.captured_queries))
+
+        connection.set_schema_to_public()
+        self.public_tenant.save()
+        with CaptureQueriesContext(connection) as queries:
+            request = self.factory.get('/any/request/', HTTP_HOST=self.public_domain.domain)
+            self.tsf.process_request(request)
+        self.assertTrue(any('"customers_client"' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(request.tenant, self.public_tenant)
+
+    @override_settings(TENANT_DOMAIN_CACHE_SIZE=10)
+    def test_async_subfolder_routing(self):
+        """
+        Under ASGI both tenants and the public tenant are served from the
+        domain cache once they have been resolved.
+        """
+        from django.db import connection
+
+        async def get_response(request):
+            return request
+
+        get_domain_cache().clear()
+        tsf = TenantSubfolderMiddleware(get_response)
+        for path, tenant in (('/clients/tenant.test.com/any/request/', self.tenant),
+                             ('/any/request/', self.public_tenant)):
+            async_to_sync(tsf)(AsyncRequestFactory().get(path))
+            connection.set_schema_to_public()
+            with self.assertNumQueries(0):
+                request = async_to_sync(tsf)(AsyncRequestFactory().get(path))
+            self.assertEqual(request.tenant, tenant)
+            self.assertEqual(connection.schema_name, tenant.schema_name)
+            connection.set_schema_to_public()
+
     def test_missing_tenant(self):
         """
         Request path should not be altered.
@@ -17,7 +17,6 @@ server-side cursor, which is exactly the regression worth catching.
 from unittest import mock
 
 from django.db import connection
-from django.test.utils import override_settings
 
 from dts_test_app.models import DummyModel
 
@@ -116,19 +115,14 @@ class ServerSideCursorTenantTest(BaseTestCase):
     def test_iterator_is_scoped_to_the_current_tenant(self):
         """
         The whole point: ``SET search_path`` must have run before ``DECLARE``, so
-        each tenant's iterator sees only its own rows.
+        each tenant's iterator sees only its own rows. The SET is skipped while
+        the connection is already on the wanted path, so switching back to a
+        tenant must still issue it.
         """
-        with tenant_context(self.tenant1):
-            self.assertEqual(
-                ['t1-a', 't1-b', 't1-c'],
-                sorted(obj.name for obj in DummyModel.objects.iterator(chunk_size=1)),
-            )
-
-        with tenant_context(self.tenant2):
-            self.assertEqual(
-                ['t2-a', 't2-b'],
-                sorted(obj.name for obj in DummyModel.objects.iterator(chunk_size=1)),
-            )
+        for tenant, names in ((self.tenant1, ['t1-a', 't1-b', 't1-c']), (self.tenant2, ['t2-a', 't2-b']),
+                              (self.tenant1, ['t1-a', 't1-b', 't1-c'])):
+            with tenant_context(tenant):
+                self.assertEqual(names, sorted(obj.name for obj in DummyModel.objects.iterator(chunk_size=1)))
 
     def test_iterator_keeps_its_schema_across_a_tenant_switch(self):
         """
@@ -150,24 +144,24 @@ class ServerSideCursorTenantTest(BaseTestCase):
 
         self.assertEqual(['t1-a', 't1-b', 't1-c'], sorted(names))
 
-    @override_settings(TENANT_LIMIT_SET_CALLS=True)
-    def test_iterator_is_tenant_scoped_with_limited_set_calls(self):
+    def test_iterator_on_the_current_path_needs_no_throwaway_cursor(self):
         """
-        ``TENANT_LIMIT_SET_CALLS`` suppresses redundant ``SET search_path`` calls
-        by caching ``search_path_set_schemas``. Switching tenant clears that cache
-        (``set_tenant``), so iterators must still be correctly scoped.
+        Once the connection is on the tenant's search_path, a named cursor is
+        declared straight away: no cursor is opened just to set the path again.
         """
         with tenant_context(self.tenant1):
-            self.assertEqual(
-                ['t1-a', 't1-b', 't1-c'],
-                sorted(obj.name for obj in DummyModel.objects.iterator(chunk_size=1)),
-            )
+            self.assertEqual(3, DummyModel.objects.count())
+
+            with mock.patch.object(connection, '_set_search_path') as set_search_path:
+                for _ in range(2):
+                    self.assertEqual(3, len(list(DummyModel.objects.iterator(chunk_size=1))))
+            self.assertFalse(set_search_path.called)
 
         with tenant_context(self.tenant2):
-            self.assertEqual(
-                ['t2-a', 't2-b'],
-                sorted(obj.name for obj in DummyModel.objects.iterator(chunk_size=1)),
-            )
+            with mock.patch.object(connection, '_set_search_path', wraps=connection._set_search_path) as set_search_path:
+                self.assertEqual(2, len(list(DummyModel.objects.iterator(chunk_size=1))))
+                self.assertEqual(2, len(list(DummyModel.objects.iterator(chunk_size=1))))
+            self.assertEqual(1, set_search_path.call_count)
 
     def test_iterator_is_tenant_scoped_without_server_side_cursors(self):
         """
@@ -195,3 +189,53 @@ class ServerSideCursorTenantTest(BaseTestCase):
                     ['t2-a', 't2-b'],
                     sorted(obj.name for obj in DummyModel.objects.iterator(chunk_size=1)),
                 )
+
+
+class ServerSideCursorSetCallsTest(BaseTestCase):
+    """
+    ``.iterator()`` costs one ``SET search_path`` per switch to another tenant,
+    and none while staying on the same one, however many chunks it fetches.
+    """
+
+    ROWS = 20
+    ROUNDS = 5
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sync_shared()
+
+    def setUp(self):
+        super().setUp()
+
+        self.tenants = []
+        for schema_name in ('cursor_bench_1', 'cursor_bench_2'):
+            tenant = get_tenant_model()(schema_name=schema_name)
+            tenant.save()
+            connection.set_schema_to_public()
+            self.tenants.append(tenant)
+
+            with tenant_context(tenant):
+                DummyModel.objects.bulk_create(DummyModel(name='row %d' % i) for i in range(self.ROWS))
+
+    def tearDown(self):
+        connection.set_schema_to_public()
+        for tenant in reversed(self.tenants):
+            tenant.delete(force_drop=True)
+
+        super().tearDown()
+
+    def count_set_calls(self, tenants):
+        with mock.patch.object(connection, '_set_search_path', wraps=connection._set_search_path) as set_search_path:
+            for tenant in tenants:
+                with tenant_context(tenant):
+                    self.assertEqual(self.ROWS, sum(1 for _ in DummyModel.objects.iterator(chunk_size=5)))
+        return set_search_path.call_count
+
+    def test_set_calls_per_iteration(self):
+        # going back to the public schema in between runs nothing there
+        self.assertEqual(len(self.tenants) * self.ROUNDS, self.count_set_calls(self.tenants * self.ROUNDS))
+
+        with tenant_context(self.tenants[0]):
+            self.assertEqual(1, self.count_set_calls(self.tenants[:1]))
+            self.assertEqual(0, self.count_set_calls(self.tenants[:1] * self.ROUNDS))
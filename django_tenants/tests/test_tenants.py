@@ -3,16 +3,18 @@ from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.exceptions import ValidationError
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.core.management import call_command
-from django.db import connection, transaction
-from django.test.utils import override_settings
+from django.db import DatabaseError, NotSupportedError, connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
 
 from django_tenants.clone import CloneSchema
 from django_tenants.signals import schema_migrated, schema_migrate_message, schema_pre_migration
 from dts_test_app.models import DummyModel, ModelWithFkToPublicUser
 
 from django_tenants.migration_executors import get_executor
+from django_tenants.postgresql_backend.sql_comment import strip_sql_comment
 from django_tenants.test.cases import TenantTestCase
 from django_tenants.tests.testcases import BaseTestCase
 from django_tenants.utils import tenant_context, schema_context, schema_exists, get_tenant_model, \
@@ -191,10 +193,10 @@ class TenantDataAndSettingsTest(BaseTestCase):
         DummyModel(name="awesome!").save()
 
         # switch temporarily to tenant2's path.
-        # TENANT_LIMIT_SET_CALLS is off, so each of the 3 inserts is preceded by its
-        # own `SET search_path` -- 6 statements, not 3. The SET was always issued;
-        # it is now run on the caller's cursor on every driver, so it is counted.
-        with self.assertNumQueries(6):
+        # The connection is on tenant1's path, so the first insert is preceded by
+        # `SET search_path`; the other two find it already applied -- 4 statements.
+        # The SET runs on the caller's cursor on every driver, so it is counted.
+        with self.assertNumQueries(4):
             with tenant_context(tenant2):
                 # add some data, 3 DummyModels for tenant2
                 DummyModel(name="Man,").save()
@@ -210,10 +212,460 @@ class TenantDataAndSettingsTest(BaseTestCase):
             with tenant_context(tenant2):
                 self.assertEqual(3, DummyModel.objects.count())
 
+        # setting the tenant the connection is already on issues no SET (COUNT)
+        connection.set_tenant(tenant1)
+        self.assertEqual(2, DummyModel.objects.count())
+        connection.set_tenant(tenant1)
+        with self.assertNumQueries(1):
+            self.assertEqual(2, DummyModel.objects.count())
+
         self.created = [domain2, domain1, tenant2, tenant1]
 
-    @override_settings(TENANT_LIMIT_SET_CALLS=True)
-    def test_switching_search_path_limited_calls(self):
+    def test_search_path_is_reapplied_after_rollback(self):
+        """
+        Rolling back undoes a `SET search_path` issued in the transaction, so
+        setting that same tenant again afterwards must re-issue it.
+        """
+        tenant1 = get_tenant_model()(schema_name='tenant1')
+        tenant1.save()
+
+        connection.set_tenant(tenant1)
+        self.assertEqual(0, DummyModel.objects.count())
+
+        try:
+            with transaction.atomic():
+                connection.set_schema_to_public()
+                get_tenant_model().objects.count()
+                raise ValueError
+        except ValueError:
+            pass
+
+        # rolled back to tenant1's path (SET + COUNT)
+        connection.set_schema_to_public()
+        with self.assertNumQueries(2):
+            get_tenant_model().objects.count()
+
+        connection.set_tenant(tenant1)
+        with transaction.atomic():
+            self.assertEqual(0, DummyModel.objects.count())
+            sid = transaction.savepoint()
+            connection.set_schema_to_public()
+            get_tenant_model().objects.count()
+            transaction.savepoint_rollback(sid)
+
+            # rolled back to the savepoint, on tenant1's path (SET + COUNT)
+            connection.set_schema_to_public()
+            with self.assertNumQueries(2):
+                get_tenant_model().objects.count()
+
+        self.created = [tenant1]
+
+    @override_settings(TENANT_PIGGYBACK_SEARCH_PATH=True)
+    def test_piggybacked_search_path(self):
+        """
+        With TENANT_PIGGYBACK_SEARCH_PATH the `SET search_path` travels with
+        the cursor's first query, and stays visible in the captured SQL.
+        """
+        tenant1 = get_tenant_model()(schema_name='tenant1')
+        tenant1.save()
+        tenant2 = get_tenant_model()(schema_name='tenant2')
+        tenant2.save()
+
+        connection.set_tenant(tenant1)
+        DummyModel(name="Schemas are").save()
+
+        with tenant_context(tenant2):
+            with CaptureQueriesContext(connection) as queries:
+                dummy = DummyModel(name="awesome!")
+                dummy.save()
+                DummyModel(name="testing").save()
+            self.assertEqual(2, len(queries))
+            self.assertTrue(queries[0]['sql'].startswith("SET search_path = 'tenant2','public'; INSERT"))
+            # the INSERT's RETURNING, not the SET, was read back
+            self.assertIsNotNone(dummy.pk)
+
+        # results and row counts are the query's
+        with self.assertNumQueries(1):
+            self.assertEqual(1, DummyModel.objects.count())
+        with tenant_context(tenant2):
+            with self.assertNumQueries(1):
+                self.assertEqual(2, DummyModel.objects.update(name="updated"))
+
+            # a failing query takes the SET with it; the next one sends it again
+            connection.set_tenant(tenant1)
+            with self.assertRaises(DatabaseError):
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1 / 0')
+            self.assertIsNone(connection.search_path_set_schemas)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(1, DummyModel.objects.count())
+        self.assertEqual(1, len(queries))
+        self.assertIn("SET search_path = 'tenant1','public'; SELECT", queries[0]['sql'])
+
+        # executemany() cannot carry it, so it is issued on its own
+        connection.set_tenant(tenant2)
+        with CaptureQueriesContext(connection) as queries:
+            with connection.cursor() as cursor:
+                cursor.executemany('INSERT INTO dts_test_app_dummymodel (name) VALUES (%s)', [('a',), ('b',)])
+        self.assertEqual(2, len(queries))
+        self.assertEqual("SET search_path = 'tenant2','public'", queries[0]['sql'])
+        self.assertEqual(4, DummyModel.objects.count())
+
+        # a cursor closed before running anything sends nothing
+        connection.set_tenant(tenant1)
+        with self.assertNumQueries(0):
+            with connection.cursor() as cursor:
+                self.assertIsNone(cursor.description)
+        self.assertEqual(['tenant2', 'public'], connection.search_path_set_schemas)
+
+        self.created = [tenant2, tenant1]
+
+    @override_settings(TENANT_TRANSACTION_POOLING=True)
+    def test_transaction_pooling_search_path(self):
+        """
+        With TENANT_TRANSACTION_POOLING the search_path is only ever set with
+        `SET LOCAL`, so it never outlives a transaction.
+        """
+        settings_dict = mock.patch.dict(connection.settings_dict, {'DISABLE_SERVER_SIDE_CURSORS': True})
+        settings_dict.start()
+        self.addCleanup(settings_dict.stop)
+        tenant1 = get_tenant_model()(schema_name='tenant1')
+        tenant1.save()
+        self.created = [tenant1]
+
+        def session_search_path():
+            with connection.cursor() as cursor:
+                cursor.cursor.execute('SHOW search_path')
+                return cursor.cursor.fetchone()[0]
+
+        connection.close()
+        default_search_path = session_search_path()
+
+        # in autocommit mode, each statement brings its own
+        connection.set_tenant(tenant1)
+        with CaptureQueriesContext(connection) as queries:
+            DummyModel(name="Schemas are").save()
+            self.assertEqual(1, DummyModel.objects.count())
+        self.assertEqual(2, len(queries))
+        for query in queries:
+            self.assertTrue(query['sql'].startswith("SET LOCAL search_path = 'tenant1','public'; "))
+        self.assertEqual(default_search_path, session_search_path())
+
+        def statements(queries):
+            # Django versions differ in whether BEGIN and COMMIT are captured
+            return [query['sql'] for query in queries if query['sql'] not in ('BEGIN', 'COMMIT')]
+
+        # in a transaction, it is set once at its start
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                DummyModel(name="awesome!").save()
+                self.assertEqual(2, DummyModel.objects.count())
+        self.assertEqual(3, len(statements(queries)))
+        self.assertEqual("SET LOCAL search_path = 'tenant1','public'", statements(queries)[0])
+        self.assertEqual(default_search_path, session_search_path())
+
+        # and again in the next one
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                self.assertEqual(2, DummyModel.objects.count())
+        self.assertEqual(2, len(statements(queries)))
+
+        # statements that cannot carry it run in a transaction of their own
+        with CaptureQueriesContext(connection) as queries:
+            with connection.cursor() as cursor:
+                cursor.executemany('INSERT INTO dts_test_app_dummymodel (name) VALUES (%s)', [('a',), ('b',)])
+        self.assertEqual("SET LOCAL search_path = 'tenant1','public'", statements(queries)[0])
+        self.assertEqual(4, DummyModel.objects.count())
+        self.assertEqual(default_search_path, session_search_path())
+
+        # a cursor opened outside a transaction brings it into one
+        with connection.cursor() as cursor:
+            with transaction.atomic():
+                cursor.execute('SELECT count(*) FROM dts_test_app_dummymodel')
+                self.assertEqual((4,), cursor.fetchone())
+
+        # and one opened in a transaction brings it along after its end
+        with transaction.atomic():
+            cursor = connection.cursor()
+        with cursor:
+            cursor.execute('SELECT count(*) FROM dts_test_app_dummymodel')
+            self.assertEqual((4,), cursor.fetchone())
+        self.assertEqual(default_search_path, session_search_path())
+
+    @override_settings(TENANT_TRANSACTION_POOLING=True)
+    def test_transaction_pooling_requires_disabled_server_side_cursors(self):
+        """
+        Named cursors cannot bring `SET LOCAL` along outside a transaction, so
+        transaction pooling refuses connections that may open them.
+        """
+        connection.close()
+        with self.assertRaises(ImproperlyConfigured):
+            connection.ensure_connection()
+        connection.close()
+
+    @override_settings(TENANT_SCHEMA_QUALIFIED_TABLES=True)
+    def test_schema_qualified_tables(self):
+        """
+        With TENANT_SCHEMA_QUALIFIED_TABLES, ORM queries name the schema of
+        each of their tables and need no search_path.
+        """
+        tenant1 = get_tenant_model()(schema_name='tenant1')
+        tenant1.save()
+        tenant2 = get_tenant_model()(schema_name='tenant2')
+        tenant2.save()
+        self.created = [tenant2, tenant1]
+
+        with tenant_context(tenant1):
+            DummyModel(name="Schemas are").save()
+
+        with tenant_context(tenant2):
+            with CaptureQueriesContext(connection) as queries:
+                DummyModel(name="awesome!").save()
+                DummyModel(name="testing").save()
+                self.assertEqual(2, DummyModel.objects.count())
+                self.assertEqual(1, DummyModel.objects.filter(name="testing").update(name="tested"))
+                DummyModel.objects.filter(name="tested").delete()
+
+                # tables of shared apps are in the public schema
+                self.assertTrue(get_tenant_model().objects.filter(schema_name='tenant1').exists())
+
+                user = User.objects.create(username='qualified')
+                ModelWithFkToPublicUser.objects.create(user=user)
+                self.assertEqual('qualified', ModelWithFkToPublicUser.objects.select_related('user').get().user.username)
+                user.delete()
+
+            self.assertFalse([query for query in queries if 'search_path' in query['sql']])
+            self.assertIn('INSERT INTO "tenant2"."dts_test_app_dummymodel"', queries[0]['sql'])
+            self.assertIn('FROM "public"."customers_client"', '\n'.join(query['sql'] for query in queries))
+            self.assertEqual(1, DummyModel.objects.count())
+
+        with tenant_context(tenant1):
+            self.assertEqual(1, DummyModel.objects.count())
+
+            # raw SQL still gets the search_path
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT name FROM dts_test_app_dummymodel')
+                self.assertEqual(("Schemas are",), cursor.fetchone())
+
+    def test_tenant_db_settings(self):
+        """
+        A tenant's database settings are applied along with its search_path,
+        and reset when switching to a tenant without them.
+        """
+        tenant1 = get_tenant_model()(schema_name='tenant1')
+        tenant1.save()
+        tenant2 = get_tenant_model()(schema_name='tenant2')
+        tenant2.save()
+        self.created = [tenant2, tenant1]
+        tenant1.get_db_settings = lambda: {'statement_timeout': '1234ms', 'work_mem': '5MB'}
+
+        def current_settings():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT current_setting('statement_timeout'), current_setting('work_mem')")
+                return cursor.fetchone()
+
+        default_settings = current_settings()
+
+        for piggyback in (False, True):
+            with self.settings(TENANT_PIGGYBACK_SEARCH_PATH=piggyback):
+                with tenant_context(tenant1):
+                    with CaptureQueriesContext(connection) as queries:
+                        self.assertEqual(('1234ms', '5MB'), current_settings())
+                        self.assertEqual(('1234ms', '5MB'), current_settings())
+                    self.assertEqual(1, len([query for query in queries if 'statement_timeout =' in query['sql']]))
+
+                with tenant_context(tenant2):
+                    self.assertEqual(default_settings, current_settings())
+
+                connection.set_schema_to_public()
+                self.assertEqual(default_settings, current_settings())
+
+        tenant1.get_db_settings = lambda: {'statement_timeout; DROP TABLE x': '1'}
+        with self.assertRaises(ValidationError):
+            connection.set_tenant(tenant1)
+        self.assertEqual(get_public_schema_name(), connection.schema_name)
+
+    @override_settings(TENANT_SQL_COMMENTER=True)
+    def test_statements_are_commented_with_the_schema(self):
+        """
+        With TENANT_SQL_COMMENTER, statements reach the database with a
+        comment naming the schema they run on.
+        """
+        tenant = get_tenant_model()(schema_name='tenant1')
+        tenant.save()
+        self.created = [tenant]
+        self.addCleanup(connection.execute_wrappers.remove, connection.comment_sql)
+        self.addCleanup(setattr, connection, 'sql_comments', None)
+
+        with tenant_context(tenant):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT current_query();')
+                self.assertEqual("SELECT current_query() /*schema_name='tenant1'*/;", cursor.fetchone()[0])
+                cursor.execute("SELECT current_query() WHERE '%%' = %s", ['%'])
+                query = cursor.fetchone()[0]
+            self.assertTrue(query.endswith(" /*schema_name='tenant1'*/"))
+            self.assertEqual("SELECT current_query() WHERE '%' = '%'", strip_sql_comment(query).replace('$1', "'%'"))
+
+            with CaptureQueriesContext(connection) as queries:
+                DummyModel.objects.count()
+            self.assertTrue(queries[-1]['sql'].endswith(" /*schema_name='tenant1'*/"))
+
+        connection.set_schema_to_public()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT current_query()')
+            self.assertEqual("SELECT current_query() /*schema_name='public'*/", cursor.fetchone()[0])
+
+    @override_settings(TENANT_INTROSPECTION_CACHE=True)
+    def test_introspection_is_scoped_to_the_schema(self):
+        """
+        Introspection only sees the current schema's tables, without setting
+        the search_path, and caches its results until DDL is run.
+        """
+        tenant = get_tenant_model()(schema_name='tenant1')
+        tenant.save()
+        self.created = [tenant]
+
+        with tenant_context(tenant):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+            with CaptureQueriesContext(connection) as queries:
+                tables = connection.introspection.table_names()
+            self.assertEqual(1, len(queries))
+            self.assertNotIn('search_path', queries[0]['sql'])
+            self.assertIn('dts_test_app_dummymodel', tables)
+            self.assertNotIn('customers_client', tables)
+            self.assertIn('name', [column.name for column in connection.introspection.get_table_description(
+                connection.cursor(), 'dts_test_app_dummymodel')])
+
+            with self.assertNumQueries(0):
+                self.assertEqual(tables, connection.introspection.table_names())
+
+            with connection.cursor() as cursor:
+                cursor.execute('CREATE TABLE introspected (id integer)')
+            self.assertIn('introspected', connection.introspection.table_names())
+
+        self.assertNotIn('introspected', connection.introspection.table_names())
+
+    def test_introspection_refuses_queries_it_cannot_scope(self):
+        """
+        An introspection query that can't be limited to the current schema
+        raises rather than describe the public schema's tables too.
+        """
+        from django.db.backends.postgresql.introspection import DatabaseIntrospection
+
+        def get_table_list(introspection, cursor):
+            cursor.execute("SELECT c.relname FROM pg_catalog.pg_class c WHERE c.relkind = 'r'")
+            return cursor.fetchall()
+
+        with mock.patch.object(DatabaseIntrospection, 'get_table_list', get_table_list):
+            with self.assertRaises(NotSupportedError):
+                connection.introspection.table_names()
+
+    def test_switching_to_the_current_tenant_is_a_no_op(self):
+        """
+        Setting the tenant or schema the connection is already on does
+        nothing, and the public schema's FakeTenant is shared.
+        """
+        tenant = get_tenant_model()(schema_name='tenant1')
+        tenant.save()
+        self.created = [tenant]
+
+        connection.set_schema_to_public()
+        public = connection.tenant
+        connection.set_schema(get_public_schema_name())
+        self.assertIs(public, connection.tenant)
+
+        with mock.patch.object(connection, 'set_settings_schema') as set_settings_schema:
+            connection.set_schema_to_public()
+            with tenant_context(tenant):
+                with tenant_context(tenant):
+                    with schema_context('tenant1'):
+                        self.assertEqual('tenant1', connection.schema_name)
+                        with schema_context('tenant1'):
+                            pass
+        # into the tenant, its FakeTenant and back, then public
+        self.assertEqual(['tenant1', 'tenant1', 'tenant1', get_public_schema_name()],
+                         [call.args[0] for call in set_settings_schema.call_args_list])
+
+        # a different include_public is a different target
+        connection.set_schema('tenant1')
+        connection.set_schema('tenant1', include_public=False)
+        self.assertFalse(connection.include_public_schema)
+
+    def test_switching_to_the_current_tenant_after_a_rename(self):
+        """
+        The current tenant renamed since it was set is switched to again.
+        """
+        tenant = get_tenant_model()(schema_name='tenant1')
+        tenant.save()
+        self.created = [tenant]
+
+        connection.set_tenant(tenant)
+        schema_rename(tenant, 'tenant1_renamed', save=False)
+        connection.set_tenant(tenant)
+        self.assertEqual('tenant1_renamed', connection.schema_name)
+        self.assertEqual([], list(DummyModel.objects.all()))
+
+        connection.set_schema_to_public()
+        tenant.save()
+
+    def test_content_types_are_cached_per_schema(self):
+        """
+        Content types are cached per schema and not cleared on each tenant
+        switch, without handing a tenant the id of another schema's.
+        """
+        tenant1 = get_tenant_model()(schema_name='tenant1')
+        tenant1.save()
+        tenant2 = get_tenant_model()(schema_name='tenant2')
+        tenant2.save()
+        self.created = [tenant2, tenant1]
+
+        with tenant_context(tenant2):
+            # give the model another id in this schema
+            ContentType.objects.filter(app_label='dts_test_app', model='dummymodel').delete()
+            ContentType.objects.clear_cache()
+
+        ids = {}
+        for tenant in (tenant1, tenant2):
+            with tenant_context(tenant):
+                ids[tenant.schema_name] = ContentType.objects.get_for_model(DummyModel).id
+        self.assertNotEqual(ids['tenant1'], ids['tenant2'])
+
+        for tenant in (tenant1, tenant2, tenant1):
+            with tenant_context(tenant):
+                with self.assertNumQueries(0):
+                    content_type = ContentType.objects.get_for_model(DummyModel)
+                    self.assertEqual(ids[tenant.schema_name], content_type.id)
+                    self.assertEqual(content_type, ContentType.objects.get_for_id(content_type.id))
+
+    def test_search_path_is_reapplied_after_changing_it_out_of_band(self):
+        """
+        A search_path changed by SQL of our own, rather than by set_tenant(),
+        is not trusted to still be the tenant's.
+        """
+        tenant1 = get_tenant_model()(schema_name='tenant1')
+        tenant1.save()
+        tenant2 = get_tenant_model()(schema_name='tenant2')
+        tenant2.save()
+        with tenant_context(tenant2):
+            DummyModel(name="tenant2's").save()
+
+        for sql in ("SET search_path = tenant2", "SELECT set_config('search_path', 'tenant2', false)",
+                    "SET SEARCH_PATH TO tenant2"):
+            connection.set_tenant(tenant1)
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+
+            # SET + COUNT
+            with self.assertNumQueries(2):
+                self.assertEqual(0, DummyModel.objects.count())
+
+        connection.set_schema_to_public()
+        self.created = [tenant2, tenant1]
+
+    def test_set_tenant_leaves_the_search_path_to_the_next_cursor(self):
         tenant1 = get_tenant_model()(schema_name='tenant1')
         tenant1.save()
 
@@ -233,8 +685,7 @@ class TenantDataAndSettingsTest(BaseTestCase):
             connection.set_tenant(tenant1)
 
         # switch temporarily to tenant2's path.
-        # TENANT_LIMIT_SET_CALLS is on, so the SET runs once for the first cursor
-        # after set_tenant cleared the cache, then the 3 inserts: 4 statements.
+        # The SET runs once for the first cursor, then the 3 inserts: 4 statements.
         with self.assertNumQueries(4):
             with tenant_context(tenant2):
                 DummyModel(name="Man,").save()
@@ -245,7 +696,7 @@ class TenantDataAndSettingsTest(BaseTestCase):
         with self.assertNumQueries(0):
             connection.set_tenant(tenant1)
 
-        # set_tenant cleared the cache, so this re-issues the SET (SET + COUNT)
+        # the connection is on tenant2's path, so this re-issues the SET (SET + COUNT)
         with self.assertNumQueries(2):
             self.assertEqual(0, DummyModel.objects.count())
 
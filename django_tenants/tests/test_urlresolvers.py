@@ -1,9 +1,12 @@
 import sys
 from importlib import import_module
+from unittest import mock
 
 from django.conf import settings
-from django.urls import reverse
+from django.test.utils import override_settings
+from django.urls import get_resolver, reverse
 
+from django_tenants import urlresolvers
 from django_tenants.tests.testcases import BaseTestCase
 from django_tenants.urlresolvers import TenantPrefixPattern, get_subfolder_urlconf
 from django_tenants.utils import get_tenant_model, get_tenant_domain_model
@@ -70,6 +73,22 @@ class URLResolversTestCase(BaseTestCase):
                 tpp.tenant_prefix, "clients/{}/".format(tenant.domain_subfolder)
             )
 
+    def test_tenant_prefix_is_memoized(self):
+        """
+        The prefix is looked up once per tenant, and again after switching.
+        """
+        from django.db import connection
+
+        tpp = TenantPrefixPattern()
+        for tenant in get_tenant_model().objects.all():
+            tenant.domain_subfolder = tenant.domains.first().domain  # Normally done by middleware
+            connection.set_tenant(tenant)
+            str(tpp)
+            with self.assertNumQueries(0):
+                for _ in range(5):
+                    self.assertEqual(tpp.tenant_prefix, "clients/{}/".format(tenant.domain_subfolder))
+                    tpp.match("/clients/{}/private/".format(tenant.domain_subfolder))
+
     def test_prefixed_reverse(self):
         from django.db import connection
 
@@ -82,3 +101,55 @@ class URLResolversTestCase(BaseTestCase):
                     self.reverser(name, tenant),
                     "/clients/{}{}".format(domain.domain, path),
                 )
+
+    def test_subfolder_urlconf_is_reused(self):
+        """
+        Each tenant gets a URLConf of its own, which is reused across requests
+        and reverses to that tenant's prefix whatever tenant is active.
+        """
+        from django.db import connection
+
+        urlconfs = {}
+        for tenant in get_tenant_model().objects.all():
+            tenant.domain_subfolder = tenant.domains.first().domain  # Normally done by middleware
+            urlconfs[tenant.domain_subfolder] = get_subfolder_urlconf(tenant)
+            self.assertEqual(get_subfolder_urlconf(tenant), urlconfs[tenant.domain_subfolder])
+
+        self.assertEqual(len(set(urlconfs.values())), 3)
+        connection.set_schema_to_public()
+        for domain_subfolder, urlconf_path in urlconfs.items():
+            self.assertEqual(
+                reverse("private", urlconf=urlconf_path),
+                "/clients/{}/private/".format(domain_subfolder),
+            )
+
+    @override_settings(TENANT_SUBFOLDER_URLCONF_CACHE_SIZE=2)
+    @mock.patch.dict(urlresolvers._subfolder_urlconfs, clear=True)
+    def test_subfolder_urlconf_cache_is_bounded(self):
+        """
+        Only the most recently used URLConfs are kept. A dropped URLConf leaves
+        sys.modules, and its tenant gets a fresh one when it comes back; the
+        resolvers already built are never changed.
+        """
+        from django.db import connection
+
+        tenants, urlconf_paths, resolvers = [], [], []
+        for tenant in get_tenant_model().objects.order_by("schema_name"):
+            tenant.domain_subfolder = tenant.domains.first().domain  # Normally done by middleware
+            urlconf_path = get_subfolder_urlconf(tenant)
+            reverse("private", urlconf=urlconf_path)
+            tenants.append(tenant)
+            urlconf_paths.append(urlconf_path)
+            resolvers.append(get_resolver(urlconf_path))
+
+        self.assertNotIn(urlconf_paths[0], sys.modules)
+        self.assertIn(urlconf_paths[1], sys.modules)
+        self.assertIs(get_resolver(urlconf_paths[1]), resolvers[1])
+        self.assertTrue(all(resolver._populated for resolver in resolvers))
+
+        connection.set_schema_to_public()
+        urlconf_path = get_subfolder_urlconf(tenants[0])
+        self.assertNotIn(urlconf_path, urlconf_paths)
+        self.assertEqual(reverse("private", urlconf=urlconf_path), "/clients/tenant1/private/")
+        self.assertNotIn(urlconf_paths[1], sys.modules)
+        self.assertTrue(all(resolver._populated for resolver in resolvers))
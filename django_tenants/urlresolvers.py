@@ -1,13 +1,17 @@
+import itertools
 import re
 import sys
+import threading
+from collections import OrderedDict
 
 from django.db import connection
 from django.conf import settings
-from django.urls import URLResolver, reverse as reverse_default
+from django.urls import URLResolver, clear_url_caches, reverse as reverse_default
 from django.utils.functional import lazy
 from django_tenants.utils import (
     get_tenant_domain_model,
     get_subfolder_prefix,
+    get_subfolder_urlconf_cache_size,
     clean_tenant_url, has_multi_type_tenants, get_tenant_types,
 )
 
@@ -20,30 +24,65 @@ def reverse(viewname, urlconf=None, args=None, kwargs=None, current_app=None):
 reverse_lazy = lazy(reverse, str)
 
 
+def get_tenant_prefix(domain_subfolder):
+    subfolder_prefix = get_subfolder_prefix()
+    return (
+        "{}/{}/".format(subfolder_prefix, domain_subfolder)
+        if subfolder_prefix
+        else "{}/".format(domain_subfolder)
+    )
+
+
 class TenantPrefixPattern:
+    """
+    Matches the tenant's subfolder prefix. Given a `tenant_prefix` the
+    pattern always matches that prefix; otherwise it is looked up for the
+    current tenant on every access.
+    """
     converters = {}
 
+    def __init__(self, tenant_prefix=None):
+        self._tenant_prefix = tenant_prefix
+
     @property
     def tenant_prefix(self):
+        if self._tenant_prefix is not None:
+            return self._tenant_prefix
+
+        # The subfolder is looked up once per tenant and remembered on it, as
+        # match(), regex and __str__ all read the prefix, often many times in a
+        # single request. The key makes a reused tenant instance look it up
+        # again after switching schema or subfolder.
+        tenant = connection.tenant
+        key = (connection.schema_name, getattr(tenant, 'domain_subfolder', None))
+        cached = getattr(tenant, '_tenant_prefix_domain', None)
+        if cached is not None and cached[0] == key:
+            domain_subfolder = cached[1]
+        else:
+            domain_subfolder = self._get_domain_subfolder(*key)
+            try:
+                tenant._tenant_prefix_domain = (key, domain_subfolder)
+            except AttributeError:
+                pass
+        return get_tenant_prefix(domain_subfolder) if domain_subfolder is not None else "/"
+
+    @staticmethod
+    def _get_domain_subfolder(schema_name, domain_subfolder):
+        if domain_subfolder is None:
+            return None
         _DomainModel = get_tenant_domain_model()
-        subfolder_prefix = get_subfolder_prefix()
         try:
-            domain = _DomainModel.objects.get(
-                tenant__schema_name=connection.schema_name,
-                domain=connection.tenant.domain_subfolder,
-            )
-            return (
-                "{}/{}/".format(subfolder_prefix, domain.domain)
-                if subfolder_prefix
-                else "{}/".format(domain.domain)
-            )
+            return _DomainModel.objects.get(
+                tenant__schema_name=schema_name,
+                domain=domain_subfolder,
+            ).domain
         except _DomainModel.DoesNotExist:
-            return "/"
+            return None
 
     @property
     def regex(self):
-        # This is only used by reverse() and cached in _reverse_dict.
-        # Note: This caching must actually be bypassed elsewhere in order to effectively switch tenants.
+        # This is only used by reverse() and cached in _reverse_dict, which is
+        # why get_subfolder_urlconf() builds a resolver per tenant prefix.
         return re.compile(self.tenant_prefix)
 
     def match(self, path):
@@ -62,15 +101,15 @@ class TenantPrefixPattern:
         return self.tenant_prefix
 
 
-def tenant_patterns(*urls):
+def tenant_patterns(*urls, tenant_prefix=None):
     """
     Add the tenant prefix to every URL pattern within this function.
     This may only be used in the root URLconf, not in an included URLconf.
     """
-    return [URLResolver(TenantPrefixPattern(), list(urls))]
+    return [URLResolver(TenantPrefixPattern(tenant_prefix), list(urls))]
 
 
-def get_dynamic_tenant_prefixed_urlconf(urlconf, dynamic_path):
+def get_dynamic_tenant_prefixed_urlconf(urlconf, dynamic_path, tenant_prefix=None):
     """
     Generates a new URLConf module with all patterns prefixed with tenant.
     """
@@ -81,21 +120,70 @@ def get_dynamic_tenant_prefixed_urlconf(urlconf, dynamic_path):
         def __getattr__(self, attr):
             imported = import_string("{}.{}".format(urlconf, attr))
             if attr == "urlpatterns":
-                return tenant_patterns(*imported)
+                return tenant_patterns(*imported, tenant_prefix=tenant_prefix)
             return imported
 
     return LazyURLConfModule(dynamic_path)
 
 
+_subfolder_urlconfs = OrderedDict()
+_subfolder_urlconfs_lock = threading.Lock()
+_subfolder_urlconf_ids = itertools.count(1)
+_evicted_subfolder_urlconfs = 0
+
+
 def get_subfolder_urlconf(tenant):
     """
     Creates and returns a subfolder URLConf for tenant.
+
+    Each tenant prefix gets a URLConf of its own, so Django's resolver and
+    reverse caches stay valid across requests. Only the most recently used
+    ``TENANT_SUBFOLDER_URLCONF_CACHE_SIZE`` are kept: a dropped URLConf is
+    removed from ``sys.modules`` and its name never used again, so the tenant
+    gets a fresh URLConf and resolver when it comes back. Resolvers are never
+    changed once built, as other threads may be using them.
     """
+    global _evicted_subfolder_urlconfs
+
     if has_multi_type_tenants():
         urlconf = get_tenant_types()[tenant.get_tenant_type()]['URLCONF']
     else:
         urlconf = settings.ROOT_URLCONF
-    dynamic_path = urlconf + "_dynamically_tenant_prefixed"
-    if not sys.modules.get(dynamic_path):
-        sys.modules[dynamic_path] = get_dynamic_tenant_prefixed_urlconf(urlconf, dynamic_path)
+
+    domain_subfolder = getattr(tenant, 'domain_subfolder', None)
+    if domain_subfolder is None:
+        # Without a known subfolder fall back to a URLConf whose prefix
+        # follows the current tenant.
+        dynamic_path = urlconf + "_dynamically_tenant_prefixed"
+        if not sys.modules.get(dynamic_path):
+            sys.modules[dynamic_path] = get_dynamic_tenant_prefixed_urlconf(urlconf, dynamic_path)
+        return dynamic_path
+
+    tenant_prefix = get_tenant_prefix(domain_subfolder)
+    key = (urlconf, tenant_prefix)
+    with _subfolder_urlconfs_lock:
+        dynamic_path = _subfolder_urlconfs.get(key)
+        if dynamic_path is not None:
+            _subfolder_urlconfs.move_to_end(key)
+            if not sys.modules.get(dynamic_path):
+                sys.modules[dynamic_path] = get_dynamic_tenant_prefixed_urlconf(urlconf, dynamic_path, tenant_prefix)
+            return dynamic_path
+
+        dynamic_path = "{}_dynamically_tenant_prefixed_{}_{}".format(
+            urlconf, domain_subfolder, next(_subfolder_urlconf_ids))
+        sys.modules[dynamic_path] = get_dynamic_tenant_prefixed_urlconf(urlconf, dynamic_path, tenant_prefix)
+        _subfolder_urlconfs[key] = dynamic_path
+        cache_size = max(get_subfolder_urlconf_cache_size(), 1)
+        while len(_subfolder_urlconfs) > cache_size:
+            _, evicted_path = _subfolder_urlconfs.popitem(last=False)
+            sys.modules.pop(evicted_path, None)
+            _evicted_subfolder_urlconfs += 1
+
+        # Django caches a resolver per URLConf name for good, so the
+        # resolvers of dropped URLConfs are only released by clearing that
+        # cache, which is done once as many have been dropped as are kept.
+        # The cleared resolvers themselves are left as they are.
+        if _evicted_subfolder_urlconfs >= cache_size:
+            _evicted_subfolder_urlconfs = 0
+            clear_url_caches()
     return dynamic_path
@@ -71,8 +71,84 @@ def get_tenant_type_choices():
     return [(k, k) for k in tenant_types.keys()]
 
 
-def get_limit_set_calls():
-    return getattr(settings, 'TENANT_LIMIT_SET_CALLS', False)
+def get_piggyback_search_path():
+    return getattr(settings, 'TENANT_PIGGYBACK_SEARCH_PATH', False)
+
+
+def get_transaction_pooling():
+    return getattr(settings, 'TENANT_TRANSACTION_POOLING', False)
+
+
+def get_schema_qualified_tables():
+    return getattr(settings, 'TENANT_SCHEMA_QUALIFIED_TABLES', False)
+
+
+def get_sql_commenter():
+    return getattr(settings, 'TENANT_SQL_COMMENTER', False)
+
+
+def get_introspection_cache():
+    return getattr(settings, 'TENANT_INTROSPECTION_CACHE', False)
+
+
+def get_content_type_cache_size():
+    return getattr(settings, 'TENANT_CONTENT_TYPE_CACHE_SIZE', 100)
+
+
+def get_migration_state_cache_size():
+    return getattr(settings, 'TENANT_MIGRATION_STATE_CACHE_SIZE', 4)
+
+
+def get_tenant_domain_cache_size():
+    return getattr(settings, 'TENANT_DOMAIN_CACHE_SIZE', 0)
+
+
+def get_tenant_domain_cache_timeout():
+    return getattr(settings, 'TENANT_DOMAIN_CACHE_TIMEOUT', 60)
+
+
+def get_tenant_domain_negative_cache_size():
+    return getattr(settings, 'TENANT_DOMAIN_NEGATIVE_CACHE_SIZE', 0)
+
+
+def get_tenant_domain_negative_cache_timeout():
+    return getattr(settings, 'TENANT_DOMAIN_NEGATIVE_CACHE_TIMEOUT', 10)
+
+
+def get_tenant_domain_shared_cache_alias():
+    return getattr(settings, 'TENANT_DOMAIN_SHARED_CACHE', None)
+
+
+def get_tenant_domain_shared_cache_timeout():
+    return getattr(settings, 'TENANT_DOMAIN_SHARED_CACHE_TIMEOUT', 300)
+
+
+def get_tenant_domain_preload():
+    return getattr(settings, 'TENANT_DOMAIN_PRELOAD', False)
+
+
+def get_tenant_domain_preload_interval():
+    return getattr(settings, 'TENANT_DOMAIN_PRELOAD_INTERVAL', 30)
+
+
+def get_tenant_wildcard_domains():
+    return getattr(settings, 'TENANT_WILDCARD_DOMAINS', False)
+
+
+def get_tenant_resolver_paths():
+    return getattr(settings, 'TENANT_RESOLVERS', [])
+
+
+def get_tenant_header():
+    return getattr(settings, 'TENANT_HEADER', 'X-Tenant')
+
+
+def get_tenant_token_header():
+    return getattr(settings, 'TENANT_TOKEN_HEADER', 'X-Tenant-Token')
+
+
+def get_tenant_token_max_age():
+    return getattr(settings, 'TENANT_TOKEN_MAX_AGE', 300)
 
 
 def get_subfolder_prefix():
@@ -80,6 +156,10 @@ def get_subfolder_prefix():
     return subfolder_prefix.strip('/ ')
 
 
+def get_subfolder_urlconf_cache_size():
+    return getattr(settings, 'TENANT_SUBFOLDER_URLCONF_CACHE_SIZE', 100)
+
+
 def get_creation_fakes_migrations():
     """
     If TENANT_CREATION_FAKES_MIGRATIONS, tenants will be created by cloning an
@@ -240,6 +320,10 @@ def schema_rename(tenant, new_schema_name, database=get_tenant_database_alias(),
     cursor.execute(sql)
     cursor.close()
     tenant.schema_name = new_schema_name
+
+    from django_tenants.tenant_cache import evict_tenant, schema_cache_key
+    evict_tenant(tenant.pk, key=schema_cache_key(new_schema_name))
+
     if save:
         tenant.save()
 